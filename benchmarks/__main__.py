@@ -0,0 +1,79 @@
+import argparse
+import json
+import platform
+import subprocess
+import sys
+import time
+
+import PIL
+
+from benchmarks.common import configure_environment
+from benchmarks.smtp_sink import SMTPSink
+
+SUITES = ("render", "mail", "e2e")
+
+
+def _git_revision() -> str | None:
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True, check=True
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def _parse_args() -> argparse.Namespace:
+    parser = argparse.ArgumentParser(
+        prog="python -m benchmarks",
+        description="Offline benchmarks for rendering, mail assembly and the end-to-end invitation pipeline. "
+        "Run from the repository root; results are printed as JSON.",
+    )
+    parser.add_argument("--suite", action="append", dest="suites", choices=SUITES, help="run only these suites")
+    parser.add_argument("--config", default="storage/config.json")
+    parser.add_argument("--iterations", type=int, default=20, help="renders per preset and messages in the mail suite")
+    parser.add_argument("--preset", action="append", dest="presets", help="limit the render suite to these presets")
+    parser.add_argument("--requests", type=int, default=200, help="POST /invitation calls in the e2e suite")
+    parser.add_argument("--concurrency", type=int, default=8)
+    parser.add_argument(
+        "--mode",
+        choices=["eager", "memory"],
+        default="eager",
+        help="eager runs tasks inside the request; memory uses an in-process broker and worker threads",
+    )
+    parser.add_argument("--output", help="write the JSON report to this file instead of stdout")
+    return parser.parse_args()
+
+
+def main():
+    args = _parse_args()
+    suites = args.suites or SUITES
+    sink = SMTPSink().start()
+    configure_environment(sink.port, args.config)
+    # The suites import src, whose settings are read from the environment configured above
+    from benchmarks import e2e, mail, render  # noqa: PLC0415
+
+    report = {
+        "revision": _git_revision(),
+        "timestamp": time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime()),
+        "python": platform.python_version(),
+        "pillow": PIL.__version__,
+        "platform": platform.platform(),
+    }
+    if "render" in suites:
+        report["render"] = render.run(args.config, args.iterations, args.presets)
+    if "mail" in suites:
+        report["mail"] = mail.run(args.config, args.iterations, sink)
+    if "e2e" in suites:
+        report["e2e"] = e2e.run(args.config, args.requests, args.concurrency, args.mode, sink)
+    sink.shutdown()
+
+    text = json.dumps(report, ensure_ascii=False, indent=2)
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as file:
+            file.write(text + "\n")
+    else:
+        sys.stdout.write(text + "\n")
+
+
+if __name__ == "__main__":
+    main()
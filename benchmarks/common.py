@@ -0,0 +1,41 @@
+import json
+import os
+import tempfile
+from typing import Any
+
+
+def configure_environment(smtp_port: int, config_path: str = "storage/config.json"):
+    # Must run before anything imports src.config; spawned render processes inherit these variables
+    os.environ.setdefault("API_KEY", "benchmark")
+    os.environ.setdefault("TEMPLATE_FOLDER", "storage/templates")
+    os.environ.setdefault("FONT_FOLDER", "storage/fonts")
+    os.environ["CONFIG_PATH"] = config_path
+    os.environ["SMTP_SERVER"] = "127.0.0.1"
+    os.environ["SMTP_PORT"] = str(smtp_port)
+    os.environ["SMTP_SSL"] = "false"
+    os.environ["SMTP_USER"] = "benchmark@example.com"
+    os.environ["SMTP_PASSWORD"] = "benchmark"
+    # The shared send limiter would cap throughput at its rate and hide what the pipeline itself does
+    os.environ["SMTP_RATE_LIMIT"] = "0"
+    # Every render must do the full work, and cold template decodes must not depend on earlier runs
+    os.environ["RENDER_CACHE_DIR"] = ""
+    os.environ["RENDER_CACHE_REDIS"] = "false"
+    os.environ["TEMPLATE_STORE_DIR"] = tempfile.mkdtemp(prefix="img-invitation-bench-")
+    os.environ["WORKER_METRICS_PORT"] = "0"
+
+
+def load_config(config_path: str) -> dict[str, Any]:
+    with open(config_path, encoding="utf-8") as file:
+        return json.load(file)
+
+
+def sample_invitation(config: dict[str, Any], preset: str, index: int = 0) -> dict[str, str]:
+    cities = sorted(config.get("city2phone", {})) or [""]
+    return {
+        "type": preset,
+        "date": "31 декабря",
+        "time": "18:30",
+        "city": cities[index % len(cities)],
+        "address": f"ул. Бенчмарковая, д. {index + 1}",
+        "email": f"guest{index}@example.com",
+    }
@@ -0,0 +1,113 @@
+import asyncio
+import contextlib
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any
+
+import redis
+from celery.contrib.testing.worker import start_worker
+from fastapi.testclient import TestClient
+
+from benchmarks.common import load_config, sample_invitation
+from benchmarks.smtp_sink import SMTPSink
+from benchmarks.stats import summarize_ms
+from main import app
+from src.celery_app import DELIVER_QUEUE, RENDER_QUEUE, celery_app
+from src.config import settings
+from src.utils import redis_client
+
+
+def _redis_backend() -> tuple[str, Any]:
+    try:
+        redis_client.get_redis().ping()
+    except redis.RedisError:
+        try:
+            import fakeredis  # noqa: PLC0415
+        except ImportError:
+            raise RuntimeError("The end-to-end benchmark needs Redis at REDIS_URL or the fakeredis package")  # noqa: B904
+        # Image handoff, delivery deduplication and the config listener all go through get_redis
+        server = fakeredis.FakeServer()
+        redis_client._client = fakeredis.FakeRedis(server=server)
+        return "fakeredis", server
+    return "redis", None
+
+
+async def _use_fake_async_redis(server):
+    import fakeredis.aioredis  # noqa: PLC0415
+
+    # Submission idempotency and the queue-depth probe use the async client, which is bound to the loop serving
+    # the requests; without this they would wait on a connection to REDIS_URL for every request
+    redis_client._async_client = fakeredis.aioredis.FakeRedis(server=server)
+    redis_client._async_client_loop = asyncio.get_running_loop()
+
+
+def _post(client, api_key: str, payload: dict[str, str]) -> tuple[float, float, int]:
+    started = time.perf_counter()
+    response = client.post("/invitation", data=payload, headers={"api-key": api_key})
+    return started, time.perf_counter() - started, response.status_code
+
+
+def run(config_path: str, requests: int, concurrency: int, mode: str, sink: SMTPSink) -> dict[str, Any]:
+    # The API publishes tasks by name; eager mode and the embedded worker need them registered
+    celery_app.loader.import_default_modules()
+
+    backend, fake_server = _redis_backend()
+    celery_app.conf.update(result_backend="cache+memory://", task_always_eager=mode == "eager")
+    if mode == "memory":
+        # The in-memory transport polls its queues and only acks between polls, so a short interval and an unbounded
+        # prefetch window keep the harness from dominating the latencies
+        celery_app.conf.update(
+            broker_url="memory://",
+            broker_transport_options={"polling_interval": 0.005},
+            worker_prefetch_multiplier=0,
+        )
+
+    config = load_config(config_path)
+    presets = [preset["name"] for preset in config.get("presets", [])]
+    payloads = [sample_invitation(config, presets[index % len(presets)], index) for index in range(requests + 1)]
+
+    worker = (
+        start_worker(
+            celery_app,
+            pool="threads",
+            concurrency=concurrency,
+            perform_ping_check=False,
+            loglevel="WARNING",
+            queues=[RENDER_QUEUE, DELIVER_QUEUE, "celery"],
+        )
+        if mode == "memory"
+        else contextlib.nullcontext()
+    )
+    with worker, TestClient(app) as client:
+        if fake_server is not None:
+            client.portal.call(_use_fake_async_redis, fake_server)
+        # The first request pays for imports, template decoding and the SMTP login
+        _post(client, settings.API_KEY, payloads.pop())
+        sink.wait_for(1, timeout=60)
+
+        sink.reset()
+        wall_started = time.perf_counter()
+        with ThreadPoolExecutor(concurrency) as executor:
+            results = list(executor.map(lambda payload: _post(client, settings.API_KEY, payload), payloads))
+        accepted = sum(1 for _, _, status in results if status == 200)  # noqa: PLR2004
+        delivered = sink.wait_for(accepted, timeout=max(60, requests))
+        wall = time.perf_counter() - wall_started
+
+    delivery = [
+        sink.delivered_at[payload["email"]] - started
+        for payload, (started, _, _) in zip(payloads, results, strict=True)
+        if payload["email"] in sink.delivered_at
+    ]
+    return {
+        "mode": mode,
+        "redis": backend,
+        "requests": requests,
+        "concurrency": concurrency,
+        "failed_requests": requests - accepted,
+        "delivered": sink.messages,
+        "all_delivered": delivered and accepted == requests,
+        "wall_s": round(wall, 3),
+        "throughput_per_s": round(sink.messages / wall, 2),
+        "request": summarize_ms([latency for _, latency, _ in results]),
+        "delivery": summarize_ms(delivery) if delivery else None,
+    }
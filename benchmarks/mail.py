@@ -0,0 +1,46 @@
+import time
+from typing import Any
+
+from benchmarks.common import load_config, sample_invitation
+from benchmarks.smtp_sink import SMTPSink
+from benchmarks.stats import summarize_ms
+from src.models.invitation import InvitationForm
+from src.utils.img_gen import create_invitation
+from src.utils.mail import build_email_message, send_email_with_attachment
+from src.utils.smtp_pool import smtp_pool
+
+
+def run(config_path: str, iterations: int, sink: SMTPSink) -> dict[str, Any]:
+    config = load_config(config_path)
+    preset = config["presets"][0]["name"]
+    forms = [InvitationForm(**sample_invitation(config, preset, index)) for index in range(iterations)]
+    attachment = create_invitation(forms[0])
+    # Load the email template and log in to the sink outside the measured loops
+    send_email_with_attachment(forms[0], attachment)
+
+    build_timings = []
+    message_bytes = 0
+    for form in forms:
+        started = time.perf_counter()
+        message_bytes = len(build_email_message(form, attachment))
+        build_timings.append(time.perf_counter() - started)
+
+    sink.reset()
+    send_timings = []
+    for form in forms:
+        started = time.perf_counter()
+        send_email_with_attachment(form, attachment)
+        send_timings.append(time.perf_counter() - started)
+    smtp_pool.close_all()
+
+    return {
+        "preset": preset,
+        "attachment_bytes": len(attachment),
+        "message_bytes": message_bytes,
+        "build": summarize_ms(build_timings),
+        "send": {
+            **summarize_ms(send_timings),
+            "messages_per_s": round(iterations / sum(send_timings), 2),
+            "received": sink.messages,
+        },
+    }
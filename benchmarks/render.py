@@ -0,0 +1,48 @@
+import multiprocessing
+import time
+from typing import Any
+
+from benchmarks.common import load_config, sample_invitation
+from benchmarks.stats import peak_rss_mb, summarize_ms
+from src.models.invitation import InvitationForm
+from src.utils.img_gen import render_invitation
+
+
+def _bench_preset(config_path: str, preset: str, iterations: int) -> dict[str, Any]:
+    config = load_config(config_path)
+    rss_before = peak_rss_mb()
+
+    started = time.perf_counter()
+    _, img_bytes = render_invitation(InvitationForm(**sample_invitation(config, preset)))
+    cold = time.perf_counter() - started
+
+    timings = []
+    for index in range(iterations):
+        form = InvitationForm(**sample_invitation(config, preset, index))
+        started = time.perf_counter()
+        render_invitation(form)
+        timings.append(time.perf_counter() - started)
+
+    return {
+        "preset": preset,
+        "cold_ms": round(cold * 1000, 3),
+        **summarize_ms(timings),
+        "renders_per_s": round(iterations / sum(timings), 2),
+        "output_bytes": len(img_bytes),
+        "baseline_rss_mb": rss_before,
+        "peak_rss_mb": peak_rss_mb(),
+    }
+
+
+def run(config_path: str, iterations: int, presets: list[str] | None = None) -> list[dict[str, Any]]:
+    names = presets or [preset["name"] for preset in load_config(config_path).get("presets", [])]
+    # A fresh process per preset keeps one template's peak RSS from leaking into the next measurement
+    context = multiprocessing.get_context("spawn")
+    results = []
+    with context.Pool(1, maxtasksperchild=1) as pool:
+        for name in names:
+            try:
+                results.append(pool.apply(_bench_preset, (config_path, name, iterations)))
+            except Exception as e:
+                results.append({"preset": name, "error": f"{type(e).__name__}: {e}"})
+    return results
@@ -0,0 +1,78 @@
+import socketserver
+import threading
+import time
+
+
+class _SMTPHandler(socketserver.StreamRequestHandler):
+    def _reply(self, line: str):
+        self.wfile.write(line.encode("ascii") + b"\r\n")
+
+    def handle(self):
+        self._reply("220 benchmark sink ready")
+        recipients: list[str] = []
+        while line := self.rfile.readline():
+            command = line[:4].upper()
+            if command in {b"EHLO", b"HELO"}:
+                self._reply("250-benchmark sink")
+                self._reply("250 AUTH PLAIN")
+            elif command == b"AUTH":
+                self._reply("235 Authentication successful")
+            elif command == b"RCPT":
+                recipients.append(line.split(b":", 1)[1].strip().strip(b"<>").decode("utf-8", "replace"))
+                self._reply("250 OK")
+            elif command == b"DATA":
+                self._reply("354 End data with <CR><LF>.<CR><LF>")
+                size = 0
+                while (chunk := self.rfile.readline()) not in {b".\r\n", b""}:
+                    size += len(chunk)
+                self.server.record(recipients, size)
+                recipients = []
+                self._reply("250 OK")
+            elif command == b"RSET":
+                recipients = []
+                self._reply("250 OK")
+            elif command == b"QUIT":
+                self._reply("221 Bye")
+                return
+            else:
+                self._reply("250 OK")
+
+
+class SMTPSink(socketserver.ThreadingTCPServer):
+    allow_reuse_address = True
+    daemon_threads = True
+
+    def __init__(self, host: str = "127.0.0.1", port: int = 0):
+        super().__init__((host, port), _SMTPHandler)
+        self.messages = 0
+        self.bytes = 0
+        self.delivered_at: dict[str, float] = {}
+        self._lock = threading.Lock()
+        self._delivered = threading.Condition(self._lock)
+
+    @property
+    def port(self) -> int:
+        return self.server_address[1]
+
+    def record(self, recipients: list[str], size: int):
+        now = time.perf_counter()
+        with self._lock:
+            self.messages += 1
+            self.bytes += size
+            for recipient in recipients:
+                self.delivered_at[recipient] = now
+            self._delivered.notify_all()
+
+    def reset(self):
+        with self._lock:
+            self.messages = 0
+            self.bytes = 0
+            self.delivered_at.clear()
+
+    def wait_for(self, count: int, timeout: float) -> bool:
+        with self._lock:
+            return self._delivered.wait_for(lambda: self.messages >= count, timeout)
+
+    def start(self) -> "SMTPSink":
+        threading.Thread(target=self.serve_forever, name="smtp-sink", daemon=True).start()
+        return self
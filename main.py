@@ -1,8 +1,26 @@
+import contextlib
+
 import uvicorn
 from fastapi import FastAPI
+from fastapi.concurrency import run_in_threadpool
 from fastapi.middleware.cors import CORSMiddleware
 
-from src.routers import config_editor, invitation
+from src.config import settings
+from src.routers import config_editor, invitation, metrics
+from src.utils.compression import JSONCompressionMiddleware
+from src.utils.config_store import publish_assets_changed
+from src.utils.profiling import ProfilingMiddleware
+from src.utils.upload_limit import UploadLimitMiddleware
+
+
+@contextlib.asynccontextmanager
+async def lifespan(_: FastAPI):
+    # Brings the blob store up to date with whatever was changed on disk while the API was down
+    await run_in_threadpool(publish_assets_changed)
+    with contextlib.suppress(FileNotFoundError):
+        await run_in_threadpool(config_editor.config_ui.load)
+    yield
+
 
 app = FastAPI(
     title="Image generating API",
@@ -11,8 +29,11 @@ app = FastAPI(
     root_path="/api",
     docs_url="/docs",
     redoc_url="/docs/redoc",
+    lifespan=lifespan,
 )
 
+# Added first so it sits inside CORS and its 413 responses carry the CORS headers
+app.add_middleware(UploadLimitMiddleware, max_bytes=settings.UPLOAD_MAX_BYTES)
 # CORS
 app.add_middleware(
     CORSMiddleware,
@@ -21,10 +42,13 @@ app.add_middleware(
     allow_methods=["*"],
     allow_headers=["*"],
 )
+app.add_middleware(JSONCompressionMiddleware, minimum_size=settings.COMPRESSION_MIN_BYTES)
+app.add_middleware(ProfilingMiddleware)
 
 # Include routers
 app.include_router(invitation.router)
 app.include_router(config_editor.router)
+app.include_router(metrics.router)
 
 if __name__ == "__main__":
     host = "0.0.0.0"
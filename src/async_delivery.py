@@ -0,0 +1,223 @@
+import asyncio
+import base64
+import json
+import logging
+import signal
+import time
+import uuid
+from datetime import UTC, datetime
+from typing import Any
+
+import redis
+
+from src.celery_app import DELIVER_QUEUE
+from src.config import settings
+from src.models.invitation import InvitationForm
+from src.utils.async_smtp_pool import async_smtp_pool
+from src.utils.config_store import config_store
+from src.utils.dead_letter import push_dead_letter
+from src.utils.delivery import form_key, preset_label, retry_backoff
+from src.utils.idempotency import claim_delivery, release_delivery
+from src.utils.image_handoff import load_image
+from src.utils.mail import TransientDeliveryError, send_email_with_attachment_async
+from src.utils.metrics import INVITATIONS, start_worker_exporter
+from src.utils.rate_limit import smtp_rate_limiter
+from src.utils.redis_client import get_async_redis
+
+logger = logging.getLogger(__name__)
+
+DELIVER_TASK = "deliver_invitation_task"
+SCHEDULED_KEY = "img-invitation:deliver-scheduled"
+
+# Kombu keeps messages with priority n > 0 under "<queue>\x06\x16<n>"; BRPOP takes from the keys in this order
+_QUEUE_KEYS = [DELIVER_QUEUE, *(f"{DELIVER_QUEUE}\x06\x16{priority}" for priority in (3, 6, 9))]
+_PROMOTE_BATCH = 100
+
+# Moves due messages back onto the queue in one step, so two consumers never both requeue the same one
+_PROMOTE_SCRIPT = """
+local due = redis.call('ZRANGEBYSCORE', KEYS[1], '-inf', ARGV[1], 'LIMIT', 0, tonumber(ARGV[2]))
+for _, payload in ipairs(due) do
+    redis.call('ZREM', KEYS[1], payload)
+    redis.call('LPUSH', KEYS[2], payload)
+end
+return #due
+"""
+
+
+def _decode(payload: bytes) -> tuple[dict[str, Any], list[Any]]:
+    message = json.loads(payload)
+    body = message["body"]
+    if message["properties"].get("body_encoding") == "base64":
+        body = base64.b64decode(body)
+    return message, json.loads(body)
+
+
+def _retry_payload(message: dict[str, Any], body: list[Any], due: float) -> str:
+    args, kwargs, _ = body
+    headers = {
+        **message["headers"],
+        "retries": message["headers"].get("retries", 0) + 1,
+        "eta": datetime.fromtimestamp(due, UTC).isoformat(),
+        "argsrepr": repr(tuple(args)),
+        "kwargsrepr": repr(kwargs),
+    }
+    properties = {**message["properties"], "body_encoding": "base64", "delivery_tag": str(uuid.uuid4())}
+    encoded = base64.b64encode(json.dumps(body, ensure_ascii=False).encode("utf-8")).decode("ascii")
+    return json.dumps({**message, "body": encoded, "headers": headers, "properties": properties}, ensure_ascii=False)
+
+
+async def _schedule(payload: bytes | str, due: float):
+    await get_async_redis().zadd(SCHEDULED_KEY, {payload: due})
+
+
+def _bind(image_key: str, invitation_data: dict, attempt: int = 0, idempotency_key: str | None = None):
+    return image_key, invitation_data, attempt, idempotency_key
+
+
+def _load_attachment(image_key: str, form: InvitationForm) -> bytes:
+    img_bytes = load_image(image_key)
+    if img_bytes is None:
+        # The handed-off image expired before delivery; this is the only path that needs Pillow in this process
+        from src.utils.img_gen import create_invitation  # noqa: PLC0415
+
+        img_bytes = create_invitation(form)
+    return img_bytes
+
+
+class DeliveryConsumer:
+    def __init__(self, concurrency: int):
+        self._slots = asyncio.Semaphore(concurrency)
+        self._tasks: set[asyncio.Task] = set()
+        self._stopping = asyncio.Event()
+
+    def stop(self):
+        self._stopping.set()
+
+    async def run(self):
+        promoter = asyncio.create_task(self._promote_scheduled())
+        try:
+            while not self._stopping.is_set():
+                # Messages are acked on receipt as in the Celery workers, so only take one when it can start right away
+                await self._slots.acquire()
+                try:
+                    item = await get_async_redis().brpop(_QUEUE_KEYS, timeout=1)
+                except redis.RedisError as e:
+                    self._slots.release()
+                    logger.warning("Failed to read the %s queue: %s", DELIVER_QUEUE, e)
+                    await asyncio.sleep(1)
+                    continue
+                if item is None:
+                    self._slots.release()
+                    continue
+                task = asyncio.create_task(self._handle(item[1]))
+                self._tasks.add(task)
+                task.add_done_callback(self._finished)
+        finally:
+            promoter.cancel()
+            await asyncio.gather(*self._tasks, return_exceptions=True)
+            await async_smtp_pool.close_all()
+
+    def _finished(self, task: asyncio.Task):
+        self._tasks.discard(task)
+        self._slots.release()
+
+    async def _promote_scheduled(self):
+        script = get_async_redis().register_script(_PROMOTE_SCRIPT)
+        while True:
+            try:
+                promoted = await script(keys=[SCHEDULED_KEY, DELIVER_QUEUE], args=[time.time(), _PROMOTE_BATCH])
+            except redis.RedisError as e:
+                logger.warning("Failed to requeue scheduled deliveries: %s", e)
+                promoted = 0
+            if promoted < _PROMOTE_BATCH:
+                await asyncio.sleep(settings.DELIVERY_SCHEDULE_INTERVAL)
+
+    async def _handle(self, payload: bytes):
+        try:
+            message, body = _decode(payload)
+            task_name = message["headers"].get("task")
+            if task_name != DELIVER_TASK:
+                logger.error("Dropping unexpected task %s from the %s queue", task_name, DELIVER_QUEUE)
+                return
+            eta = message["headers"].get("eta")
+            if eta and (due := datetime.fromisoformat(eta).timestamp()) > time.time():
+                # Retries published by Celery workers wait in Redis rather than in this process
+                await _schedule(payload, due)
+                return
+            await self._deliver(message, body)
+        except Exception:
+            logger.exception("Failed to handle a delivery message")
+
+    async def _deliver(self, message: dict[str, Any], body: list[Any]):
+        args, kwargs, embed = body
+        image_key, invitation_data, attempt, idempotency_key = _bind(*args, **kwargs)
+        task_id = message["headers"]["id"]
+        email = invitation_data.get("email", "unknown")
+        preset = await asyncio.to_thread(preset_label, invitation_data)
+
+        dedup_key = idempotency_key or form_key(invitation_data)
+        if not await asyncio.to_thread(claim_delivery, dedup_key, task_id):
+            INVITATIONS.labels(preset=preset, result="duplicate").inc()
+            logger.info("Skipping duplicate invitation for %s", email)
+            return
+
+        granted, wait = await asyncio.to_thread(smtp_rate_limiter.reserve)
+        if not granted:
+            # The send slots for the next SMTP_RATE_MAX_WAIT seconds are taken; come back when ours frees up
+            due = time.time() + wait
+            await _schedule(_retry_payload(message, body, due), due)
+            return
+        await asyncio.sleep(wait)
+
+        try:
+            form = InvitationForm(**invitation_data)
+            img_bytes = await asyncio.to_thread(_load_attachment, image_key, form)
+            await send_email_with_attachment_async(form, img_bytes)
+            INVITATIONS.labels(preset=preset, result="sent").inc()
+            logger.info("Invitation created and sent successfully for %s", form.email)
+        except TransientDeliveryError as e:
+            # Nothing was sent, so a duplicate submitted meanwhile may go out instead of this one
+            await asyncio.to_thread(release_delivery, dedup_key, task_id)
+            if attempt < settings.DELIVERY_MAX_RETRIES:
+                countdown = retry_backoff(attempt)
+                INVITATIONS.labels(preset=preset, result="retried").inc()
+                logger.warning("Delivery to %s failed, retrying in %.0fs: %s", email, countdown, str(e))
+                retry_body = [
+                    [image_key, invitation_data],
+                    {"attempt": attempt + 1, "idempotency_key": idempotency_key},
+                    embed,
+                ]
+                due = time.time() + countdown
+                await _schedule(_retry_payload(message, retry_body, due), due)
+                return
+            INVITATIONS.labels(preset=preset, result="failed").inc()
+            logger.error("Giving up on invitation for %s after %d attempts: %s", email, attempt + 1, str(e))
+            await asyncio.to_thread(push_dead_letter, invitation_data, str(e), attempt + 1)
+        except Exception as e:
+            await asyncio.to_thread(release_delivery, dedup_key, task_id)
+            INVITATIONS.labels(preset=preset, result="failed").inc()
+            logger.error("Failed to create invitation for %s: %s", email, str(e))
+            await asyncio.to_thread(push_dead_letter, invitation_data, str(e), attempt + 1)
+
+
+async def run_delivery_worker():
+    config_store.start_listener()
+    if settings.WORKER_METRICS_PORT:
+        start_worker_exporter(settings.WORKER_METRICS_PORT)
+
+    consumer = DeliveryConsumer(settings.DELIVERY_CONCURRENCY)
+    loop = asyncio.get_running_loop()
+    for sig in (signal.SIGINT, signal.SIGTERM):
+        loop.add_signal_handler(sig, consumer.stop)
+    logger.info(
+        "Consuming the %s queue with up to %d deliveries over %d SMTP connections",
+        DELIVER_QUEUE,
+        settings.DELIVERY_CONCURRENCY,
+        settings.DELIVERY_SMTP_CONNECTIONS,
+    )
+    await consumer.run()
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO, format="[%(asctime)s: %(levelname)s/%(name)s] %(message)s")
+    asyncio.run(run_delivery_worker())
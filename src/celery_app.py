@@ -1,6 +1,19 @@
-from celery import Celery
+import threading
+from typing import Any
+
+from celery import Celery, chain
+from celery.canvas import Signature
+from celery.signals import task_postrun, task_prerun, worker_init, worker_process_init, worker_process_shutdown
 
 from src.config import settings
+from src.utils.assets import asset_cache
+from src.utils.config_store import config_store, listen_config_changes
+from src.utils.metrics import mark_worker_process_dead, start_worker_exporter
+from src.utils.profiling import begin_task_profile, end_task_profile
+from src.utils.smtp_pool import smtp_pool
+
+RENDER_QUEUE = "render"
+DELIVER_QUEUE = "deliver"
 
 celery_app = Celery(
     "img-invitation-service",
@@ -17,8 +30,80 @@ celery_app.conf.update(
     enable_utc=True,
     task_time_limit=30,
     task_soft_time_limit=20,
+    task_routes={
+        "render_invitation_task": {"queue": RENDER_QUEUE},
+        "deliver_invitation_task": {"queue": DELIVER_QUEUE},
+        "generate_invitation_batch_task": {"queue": RENDER_QUEUE},
+    },
+    task_annotations={
+        "render_invitation_task": {"time_limit": 20, "soft_time_limit": 15},
+        # Only the prefork pool enforces these; on the threads pool the deliver task bounds its SMTP send itself
+        "deliver_invitation_task": {
+            "time_limit": settings.DELIVERY_TIME_LIMIT + 30,
+            "soft_time_limit": settings.DELIVERY_TIME_LIMIT,
+        },
+    },
     worker_prefetch_multiplier=1,
     worker_max_tasks_per_child=1000,
     result_expires=0,
     task_ignore_result=True,
 )
+
+
+def invitation_pipeline(invitation_data: dict[str, Any], idempotency_key: str | None = None) -> Signature:
+    deliver_kwargs = {"idempotency_key": idempotency_key} if idempotency_key else {}
+    return chain(
+        celery_app.signature("render_invitation_task", args=[invitation_data]),
+        celery_app.signature("deliver_invitation_task", args=[invitation_data], kwargs=deliver_kwargs),
+    )
+
+
+@worker_init.connect
+@worker_process_init.connect
+def _start_config_listener(**_):
+    config_store.start_listener()
+
+
+@worker_init.connect
+def _warm_asset_cache(**_):
+    if settings.ASSET_SOURCE == "blob":
+        # Fill the local cache before taking tasks, then follow config changes; prefork children share the cache
+        asset_cache.prefetch_quietly()
+        threading.Thread(
+            target=listen_config_changes,
+            args=(asset_cache.prefetch_quietly, settings.CONFIG_RELOAD_INTERVAL),
+            name="asset-prefetcher",
+            daemon=True,
+        ).start()
+
+
+@worker_init.connect
+def _start_metrics_exporter(**_):
+    if settings.WORKER_METRICS_PORT:
+        start_worker_exporter(settings.WORKER_METRICS_PORT)
+
+
+@worker_process_shutdown.connect
+def _close_smtp_sessions(**_):
+    smtp_pool.close_all()
+
+
+@worker_process_shutdown.connect
+def _mark_metrics_process_dead(pid: int, **_):
+    mark_worker_process_dead(pid)
+
+
+@task_prerun.connect
+def _start_task_profile(task_id: str, **_):
+    begin_task_profile(task_id)
+
+
+@task_postrun.connect
+def _finish_task_profile(task_id: str, task, args=(), **_):
+    invitation = next((arg for arg in args if isinstance(arg, dict) and "type" in arg), None)
+    tags = {"stage": task.name}
+    if invitation is not None:
+        tags["preset"] = invitation["type"]
+    elif args and isinstance(args[0], list):
+        tags["preset"] = "batch"
+    end_task_profile(task_id, tags)
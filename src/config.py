@@ -1,3 +1,5 @@
+from typing import Literal
+
 from pydantic_settings import BaseSettings, SettingsConfigDict
 
 
@@ -14,7 +16,83 @@ class Settings(BaseSettings):
     SMTP_PORT: int
     SMTP_USER: str
     SMTP_PASSWORD: str
+    SMTP_SSL: bool = True
+    SMTP_TIMEOUT: float = 30.0
+    SMTP_POOL_SIZE: int = 2
+    SMTP_SESSION_MAX_MESSAGES: int = 50
+    SMTP_SESSION_MAX_AGE: float = 300.0
+    SMTP_NOOP_INTERVAL: float = 10.0
+    SMTP_RATE_LIMIT: float = 0.0
+    SMTP_RATE_BURST: int = 5
+    SMTP_RATE_MAX_WAIT: float = 20.0
+
+    DELIVERY_MAX_RETRIES: int = 8
+    DELIVERY_RETRY_BACKOFF: float = 30.0
+    DELIVERY_RETRY_BACKOFF_MAX: float = 1800.0
+    DELIVERY_TIME_LIMIT: float = 60.0
+    DELIVERY_CONCURRENCY: int = 200
+    DELIVERY_SMTP_CONNECTIONS: int = 10
+    DELIVERY_SCHEDULE_INTERVAL: float = 1.0
+    DEAD_LETTER_MAX_ITEMS: int = 10000
 
     REDIS_URL: str = "redis://redis:6379/0"
 
+    INVITATION_BATCH_MAX_ITEMS: int = 20000
+    INVITATION_BATCH_CHUNK_SIZE: int = 50
+
+    ENQUEUE_POOL_SIZE: int = 4
+    ENQUEUE_MAX_QUEUE_DEPTH: int = 50000
+    ENQUEUE_MAX_PUBLISH_LATENCY: float = 1.0
+    ENQUEUE_DEPTH_CHECK_INTERVAL: float = 1.0
+    ENQUEUE_RETRY_AFTER: int = 30
+
+    IDEMPOTENCY_WINDOW: int = 600
+    IDEMPOTENCY_KEY_TTL: int = 24 * 3600
+
+    CONFIG_RELOAD_INTERVAL: float = 2.0
+    CONFIG_FLUSH_DELAY: float = 0.05
+
+    TEMPLATE_CACHE_MAX_BYTES: int = 256 * 1024 * 1024
+    TEMPLATE_STORE_DIR: str = "/tmp/img-invitation-templates"
+    TEXT_SPRITE_CACHE_ITEMS: int = 4096
+    TEMPLATE_MAX_DIMENSION: int = 0
+    TEMPLATE_JPEG_QUALITY: int = 95
+    TEMPLATE_THUMBNAIL_SIZE: int = 320
+
+    BLOB_STORE: Literal["", "redis", "local"] = ""
+    BLOB_STORE_DIR: str = "storage/blobs"
+    ASSET_SOURCE: Literal["local", "blob"] = "local"
+    ASSET_CACHE_DIR: str = "/tmp/img-invitation-assets"
+
+    RENDER_CACHE_DIR: str = "storage/cache/renders"
+    RENDER_CACHE_TTL: int = 3 * 24 * 3600
+    RENDER_CACHE_MAX_BYTES: int = 1024 * 1024 * 1024
+    RENDER_CACHE_SWEEP_INTERVAL: float = 60.0
+    RENDER_CACHE_REDIS: bool = False
+
+    IMAGE_HANDOFF_TTL: int = 3600
+
+    UPLOAD_MAX_BYTES: int = 20 * 1024 * 1024
+    UPLOAD_CHUNK_SIZE: int = 1024 * 1024
+
+    PREVIEW_POOL_SIZE: int = 2
+    PREVIEW_CACHE_ITEMS: int = 32
+
+    RENDER_POOL_SIZE: int = 2
+    RENDER_MAX_PENDING: int = 64
+    RENDER_HTTP_MAX_AGE: int = 24 * 3600
+
+    WORKER_METRICS_PORT: int = 9100
+
+    COMPRESSION_MIN_BYTES: int = 1024
+    COMPRESSION_GZIP_LEVEL: int = 6
+    COMPRESSION_BROTLI_QUALITY: int = 5
+    CONFIG_UI_MAX_AGE: int = 600
+
+    PROFILING_ENABLED: bool = False
+    PROFILING_SAMPLE_RATE: float = 0.01
+    PROFILING_THRESHOLD: float = 1.0
+    PROFILING_DIR: str = "storage/profiles"
+    PROFILING_MAX_FILES: int = 200
+
 settings = Settings()
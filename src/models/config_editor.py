@@ -1,6 +1,6 @@
 from typing import Literal
 
-from pydantic import BaseModel, Field, field_validator
+from pydantic import BaseModel, Field, field_validator, model_validator
 
 
 class City(BaseModel):
@@ -27,10 +27,28 @@ class TextItem(BaseModel):
         return value
 
 
+class OutputProfile(BaseModel):
+    max_width: int | None = Field(default=None, ge=1)
+    max_height: int | None = Field(default=None, ge=1)
+    quality: int = Field(default=75, ge=1, le=95)
+    subsampling: Literal["4:4:4", "4:2:2", "4:2:0"] | None = None
+    optimize: bool = False
+    progressive: bool = False
+    max_bytes: int | None = Field(default=None, ge=1)
+    min_quality: int = Field(default=40, ge=1, le=95)
+
+    @model_validator(mode="after")
+    def min_quality_not_above_quality(self) -> "OutputProfile":
+        if self.min_quality > self.quality:
+            raise ValueError("min_quality must not exceed quality")
+        return self
+
+
 class Preset(BaseModel):
     name: str = Field(min_length=1)
     template: str = Field(min_length=1)
     texts: list[TextItem]
+    output: OutputProfile | None = None
 
     @field_validator("texts")
     @classmethod
@@ -45,3 +63,27 @@ class Preset(BaseModel):
             missing = required - set(seen)
             raise ValueError(f"missing text types: {', '.join(sorted(missing))}")
         return v
+
+
+class TemplateSource(BaseModel):
+    width: int
+    height: int
+    mode: str
+    format: str | None
+    bytes: int
+
+
+class TemplateInfo(BaseModel):
+    filename: str
+    status: Literal["processing", "ready", "failed"]
+    width: int | None = None
+    height: int | None = None
+    mode: str | None = None
+    format: str | None = None
+    bytes: int | None = None
+    sha256: str | None = None
+    original: TemplateSource | None = None
+    scale: float = 1.0
+    normalized: bool = False
+    error: str | None = None
+    updated_at: float | None = None
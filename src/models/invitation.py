@@ -1,3 +1,5 @@
+from typing import Any, Literal
+
 from pydantic import BaseModel
 
 
@@ -14,3 +16,34 @@ class InvitationResult(BaseModel):
     result: str
     invitation: str
     email: str
+
+
+class InvitationBatchItem(BaseModel):
+    index: int
+    result: Literal["accepted", "rejected"]
+    email: str | None = None
+    error: str | None = None
+
+
+class InvitationBatchResult(BaseModel):
+    accepted: int
+    rejected: int
+    items: list[InvitationBatchItem]
+
+
+class DeadLetterEntry(BaseModel):
+    id: str
+    invitation: dict[str, Any]
+    error: str
+    attempts: int
+    failed_at: float
+
+
+class DeadLetterList(BaseModel):
+    total: int
+    items: list[DeadLetterEntry]
+
+
+class DeadLetterReplayResult(BaseModel):
+    replayed: int
+    ids: list[str]
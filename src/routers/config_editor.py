@@ -1,36 +1,55 @@
-import json
+import contextlib
 import os
+import tempfile
+from collections import OrderedDict
+from collections.abc import Callable
 from typing import Any
 
-from fastapi import APIRouter, Depends, File, HTTPException, UploadFile, status
+import anyio
+from fastapi import APIRouter, BackgroundTasks, Depends, File, Header, HTTPException, Query, UploadFile, status
 from fastapi.concurrency import run_in_threadpool
-from fastapi.responses import FileResponse, Response
+from fastapi.responses import FileResponse, JSONResponse, Response
 
 from src.config import settings
-from src.models.config_editor import City, Preset
+from src.models.config_editor import City, Preset, TemplateInfo
 from src.models.invitation import InvitationForm
 from src.utils.auth import verify_api_key
-from src.utils.img_gen import _gen_invitation_img
+from src.utils.compression import preferred_encoding
+from src.utils.config_repo import ConfigState, config_repo
+from src.utils.config_store import publish_assets_changed
+from src.utils.http_cache import etag_matches
+from src.utils.preview import run_preview
+from src.utils.profiling import list_profiles, profile_path
+from src.utils.render_cache import render_key
+from src.utils.static_assets import StaticAsset
+from src.utils.template_index import template_index
+from src.utils.template_ingest import ingest_template
+from src.utils.template_store import template_store
 
 router = APIRouter(prefix="/config", tags=["Config editor"])
 
+_preview_cache: OrderedDict[str, bytes] = OrderedDict()
 
-def _load_config() -> dict[str, Any]:
-    try:
-        with open(settings.CONFIG_PATH, encoding="utf-8") as f:
-            return json.load(f)
-    except FileNotFoundError:
-        raise HTTPException(status_code=status.HTTP_500_INTERNAL_SERVER_ERROR, detail="Config file not found")  # noqa: B904
-    except json.JSONDecodeError as e:
-        raise HTTPException(status_code=status.HTTP_500_INTERNAL_SERVER_ERROR, detail=f"Invalid config.json: {e!s}")  # noqa: B904
+config_ui = StaticAsset(os.path.join("storage", "config-ui", "index.html"))
 
 
-def _save_config(cfg: dict[str, Any]) -> None:
-    try:
-        with open(settings.CONFIG_PATH, "w", encoding="utf-8") as f:
-            json.dump(cfg, f, ensure_ascii=False, indent=4)
-    except Exception as e:
-        raise HTTPException(status_code=status.HTTP_500_INTERNAL_SERVER_ERROR, detail=f"Failed to save config: {e!s}")  # noqa: B904
+def _config_headers(state: ConfigState) -> dict[str, str]:
+    return {"ETag": state.etag, "X-Config-Version": str(state.version), "Cache-Control": "private, no-cache"}
+
+
+def _conditional_json(state: ConfigState, if_none_match: str | None, content: Any) -> Response:
+    headers = _config_headers(state)
+    if etag_matches(if_none_match, state.etag):
+        return Response(status_code=status.HTTP_304_NOT_MODIFIED, headers=headers)
+    return JSONResponse(content, headers=headers)
+
+
+async def _modify_config(
+    response: Response, mutate: Callable[[dict[str, Any]], None], if_match: str | None
+) -> dict[str, Any]:
+    state = await config_repo.modify(mutate, if_match)
+    response.headers.update(_config_headers(state))
+    return {"ok": True}
 
 
 def _safe_filename(name: str) -> str:
@@ -39,213 +58,286 @@ def _safe_filename(name: str) -> str:
     return name
 
 
+def _list_files(folder: str) -> list[str]:
+    os.makedirs(folder, exist_ok=True)
+    # Dotfiles are in-progress uploads and other internal state
+    return sorted(f for f in os.listdir(folder) if not f.startswith(".") and os.path.isfile(os.path.join(folder, f)))
+
+
+def _delete_file(path: str, kind: str):
+    if not os.path.exists(path):
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail=f"{kind.capitalize()} not found")
+    try:
+        os.remove(path)
+    except Exception as e:
+        raise HTTPException(  # noqa: B904
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR, detail=f"Failed to delete {kind}: {e!s}"
+        )
+
+
+async def _store_upload(file: UploadFile, folder: str, filename: str, kind: str):
+    await run_in_threadpool(os.makedirs, folder, exist_ok=True)
+    fd, tmp_path = await run_in_threadpool(tempfile.mkstemp, dir=folder, prefix=".upload-", suffix=".tmp")
+    try:
+        size = 0
+        async with anyio.wrap_file(os.fdopen(fd, "wb")) as out:
+            while chunk := await file.read(settings.UPLOAD_CHUNK_SIZE):
+                size += len(chunk)
+                if size > settings.UPLOAD_MAX_BYTES:
+                    raise HTTPException(
+                        status_code=status.HTTP_413_REQUEST_ENTITY_TOO_LARGE,
+                        detail=f"File exceeds {settings.UPLOAD_MAX_BYTES} bytes",
+                    )
+                await out.write(chunk)
+        await run_in_threadpool(os.chmod, tmp_path, 0o644)
+        await run_in_threadpool(os.replace, tmp_path, os.path.join(folder, filename))
+    except HTTPException:
+        await run_in_threadpool(_discard, tmp_path)
+        raise
+    except Exception as e:
+        await run_in_threadpool(_discard, tmp_path)
+        raise HTTPException(  # noqa: B904
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR, detail=f"Failed to save {kind}: {e!s}"
+        )
+
+
+def _discard(path: str):
+    with contextlib.suppress(FileNotFoundError):
+        os.remove(path)
+
+
 @router.get("", include_in_schema=False)
-async def config_page():
-    ui_index = os.path.join("storage", "config-ui", "index.html")
-    if not os.path.exists(ui_index):
-        raise HTTPException(
+async def config_page(accept_encoding: str | None = Header(None), if_none_match: str | None = Header(None)):
+    try:
+        variant = await run_in_threadpool(config_ui.variant, preferred_encoding(accept_encoding))
+    except FileNotFoundError:
+        raise HTTPException(  # noqa: B904
             status_code=status.HTTP_404_NOT_FOUND, detail="UI not found. Please add storage/config-ui/index.html"
         )
-    return FileResponse(ui_index, media_type="text/html; charset=utf-8")
+    # Browsers reuse the page for a while and then revalidate in the background, which is a 304 until a deploy
+    headers = {
+        "ETag": variant.etag,
+        "Cache-Control": f"public, max-age={settings.CONFIG_UI_MAX_AGE}, stale-while-revalidate=604800",
+        "Vary": "Accept-Encoding",
+    }
+    if variant.encoding is not None:
+        headers["Content-Encoding"] = variant.encoding
+    if etag_matches(if_none_match, variant.etag):
+        return Response(status_code=status.HTTP_304_NOT_MODIFIED, headers=headers)
+    return Response(content=variant.body, media_type="text/html; charset=utf-8", headers=headers)
 
 
 # ---------- Raw config ----------
 @router.get("/api/config", dependencies=[Depends(verify_api_key)])
-async def get_config():
-    return _load_config()
+async def get_config(if_none_match: str | None = Header(None)):
+    state = await config_repo.snapshot()
+    return _conditional_json(state, if_none_match, state.raw)
 
 
 # ---------- Cities ----------
 @router.get("/api/cities", dependencies=[Depends(verify_api_key)])
-async def list_cities():
-    cfg = _load_config()
-    phones = cfg.get("city2phone", {})
-    emails = cfg.get("city2email", {})
-    vks = cfg.get("city2vk", {})
-    all_cities = set(phones) | set(emails) | set(vks)
-    result = []
-    for city in sorted(all_cities):
-        result.append(
-            {
-                "name": city,
-                "phone": phones.get(city),
-                "email": emails.get(city),
-                "vk": vks.get(city),
-            }
-        )
-    return {"items": result}
+async def list_cities(if_none_match: str | None = Header(None)):
+    state = await config_repo.snapshot()
+    return _conditional_json(state, if_none_match, {"items": list(state.cities.values())})
 
 
 @router.post("/api/cities", dependencies=[Depends(verify_api_key)], status_code=status.HTTP_201_CREATED)
-async def add_city(city: City):
-    cfg = _load_config()
-    cfg.setdefault("city2phone", {})
-    cfg.setdefault("city2email", {})
-    cfg.setdefault("city2vk", {})
-    if city.name in cfg["city2phone"] or city.name in cfg["city2email"] or city.name in cfg["city2vk"]:
-        raise HTTPException(status_code=status.HTTP_409_CONFLICT, detail="City already exists")
-    cfg["city2phone"][city.name] = city.phone
-    cfg["city2email"][city.name] = city.email
-    cfg["city2vk"][city.name] = city.vk
-    _save_config(cfg)
-    return {"ok": True}
+async def add_city(city: City, response: Response, if_match: str | None = Header(None)):
+    def mutate(cfg: dict[str, Any]):
+        cfg.setdefault("city2phone", {})
+        cfg.setdefault("city2email", {})
+        cfg.setdefault("city2vk", {})
+        if city.name in cfg["city2phone"] or city.name in cfg["city2email"] or city.name in cfg["city2vk"]:
+            raise HTTPException(status_code=status.HTTP_409_CONFLICT, detail="City already exists")
+        cfg["city2phone"][city.name] = city.phone
+        cfg["city2email"][city.name] = city.email
+        cfg["city2vk"][city.name] = city.vk
+
+    return await _modify_config(response, mutate, if_match)
 
 
 @router.put("/api/cities/{name}", dependencies=[Depends(verify_api_key)])
-async def update_city(name: str, city: City):
+async def update_city(name: str, city: City, response: Response, if_match: str | None = Header(None)):
     if name != city.name:
         raise HTTPException(
             status_code=status.HTTP_400_BAD_REQUEST, detail="Renaming is not supported. Delete and add again."
         )
-    cfg = _load_config()
-    for key in ("city2phone", "city2email", "city2vk"):
-        if name not in cfg.get(key, {}):
-            raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="City not found")
-    cfg["city2phone"][name] = city.phone
-    cfg["city2email"][name] = city.email
-    cfg["city2vk"][name] = city.vk
-    _save_config(cfg)
-    return {"ok": True}
+
+    def mutate(cfg: dict[str, Any]):
+        for key in ("city2phone", "city2email", "city2vk"):
+            if name not in cfg.get(key, {}):
+                raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="City not found")
+        cfg["city2phone"][name] = city.phone
+        cfg["city2email"][name] = city.email
+        cfg["city2vk"][name] = city.vk
+
+    return await _modify_config(response, mutate, if_match)
 
 
 @router.delete("/api/cities/{name}", dependencies=[Depends(verify_api_key)])
-async def delete_city(name: str):
-    cfg = _load_config()
-    found = False
-    for key in ("city2phone", "city2email", "city2vk"):
-        if name in cfg.get(key, {}):
-            cfg[key].pop(name, None)
-            found = True
-    if not found:
-        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="City not found")
-    _save_config(cfg)
-    return {"ok": True}
+async def delete_city(name: str, response: Response, if_match: str | None = Header(None)):
+    def mutate(cfg: dict[str, Any]):
+        found = False
+        for key in ("city2phone", "city2email", "city2vk"):
+            if name in cfg.get(key, {}):
+                cfg[key].pop(name, None)
+                found = True
+        if not found:
+            raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="City not found")
+
+    return await _modify_config(response, mutate, if_match)
 
 
 # ---------- Fonts ----------
 @router.get("/api/fonts", dependencies=[Depends(verify_api_key)])
 async def list_fonts():
-    folder = settings.FONT_FOLDER
-    os.makedirs(folder, exist_ok=True)
-    files = [f for f in os.listdir(folder) if os.path.isfile(os.path.join(folder, f))]
-    return {"items": sorted(files)}
+    return {"items": await run_in_threadpool(_list_files, settings.FONT_FOLDER)}
 
 
 @router.post("/api/fonts", dependencies=[Depends(verify_api_key)], status_code=status.HTTP_201_CREATED)
 async def upload_font(file: UploadFile = File(...)):  # noqa: B008
     filename = _safe_filename(file.filename or "")
-    folder = settings.FONT_FOLDER
-    os.makedirs(folder, exist_ok=True)
-    dst = os.path.join(folder, filename)
-    try:
-        with open(dst, "wb") as out:
-            out.write(await file.read())
-    except Exception as e:
-        raise HTTPException(status_code=status.HTTP_500_INTERNAL_SERVER_ERROR, detail=f"Failed to save font: {e!s}")  # noqa: B904
+    await _store_upload(file, settings.FONT_FOLDER, filename, "font")
+    await run_in_threadpool(publish_assets_changed)
     return {"ok": True, "filename": filename}
 
 
 @router.delete("/api/fonts/{filename}", dependencies=[Depends(verify_api_key)])
 async def delete_font(filename: str):
     filename = _safe_filename(filename)
-    path = os.path.join(settings.FONT_FOLDER, filename)
-    if not os.path.exists(path):
-        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Font not found")
-    try:
-        os.remove(path)
-    except Exception as e:
-        raise HTTPException(status_code=status.HTTP_500_INTERNAL_SERVER_ERROR, detail=f"Failed to delete font: {e!s}")  # noqa: B904
+    await run_in_threadpool(_delete_file, os.path.join(settings.FONT_FOLDER, filename), "font")
+    await run_in_threadpool(publish_assets_changed)
     return {"ok": True}
 
 
 # ---------- Templates (images) ----------
 @router.get("/api/templates", dependencies=[Depends(verify_api_key)])
 async def list_templates():
-    folder = settings.TEMPLATE_FOLDER
-    os.makedirs(folder, exist_ok=True)
-    files = [f for f in os.listdir(folder) if os.path.isfile(os.path.join(folder, f))]
-    return {"items": sorted(files)}
+    entries = await run_in_threadpool(template_index.entries)
+    templates = [TemplateInfo.model_validate(entries[name]) for name in sorted(entries)]
+    # A template that is still being ingested for the first time has nothing on disk to render yet
+    return {"items": [t.filename for t in templates if t.sha256 is not None], "templates": templates}
 
 
-@router.post("/api/templates", dependencies=[Depends(verify_api_key)], status_code=status.HTTP_201_CREATED)
-async def upload_template(file: UploadFile = File(...)):  # noqa: B008
+@router.post("/api/templates", dependencies=[Depends(verify_api_key)], status_code=status.HTTP_202_ACCEPTED)
+async def upload_template(background_tasks: BackgroundTasks, file: UploadFile = File(...)):  # noqa: B008
     filename = _safe_filename(file.filename or "")
-    folder = settings.TEMPLATE_FOLDER
-    os.makedirs(folder, exist_ok=True)
-    dst = os.path.join(folder, filename)
+    await _store_upload(file, template_index.staging_folder, filename, "template")
+    await run_in_threadpool(template_index.update, filename, status="processing", error=None)
+    background_tasks.add_task(ingest_template, filename)
+    return {"ok": True, "filename": filename, "status": "processing"}
+
+
+@router.get("/api/templates/{filename}/thumbnail", dependencies=[Depends(verify_api_key)])
+async def get_template_thumbnail(filename: str, if_none_match: str | None = Header(None)):
+    filename = _safe_filename(filename)
+    entry = (await run_in_threadpool(template_index.entries)).get(filename)
+    if entry is None or entry.get("sha256") is None:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Template not found")
+    headers = {"ETag": f'"{entry["sha256"][:32]}"', "Cache-Control": "private, no-cache"}
+    if etag_matches(if_none_match, headers["ETag"]):
+        return Response(status_code=status.HTTP_304_NOT_MODIFIED, headers=headers)
     try:
-        with open(dst, "wb") as out:
-            out.write(await file.read())
+        path = await run_in_threadpool(template_index.ensure_thumbnail, filename)
     except Exception as e:
-        raise HTTPException(status_code=status.HTTP_500_INTERNAL_SERVER_ERROR, detail=f"Failed to save template: {e!s}")  # noqa: B904
-    return {"ok": True, "filename": filename}
+        raise HTTPException(  # noqa: B904
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR, detail=f"Failed to build thumbnail: {e!s}"
+        )
+    return FileResponse(path, media_type="image/jpeg", headers=headers)
 
 
 @router.delete("/api/templates/{filename}", dependencies=[Depends(verify_api_key)])
 async def delete_template(filename: str):
     filename = _safe_filename(filename)
     path = os.path.join(settings.TEMPLATE_FOLDER, filename)
-    if not os.path.exists(path):
-        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Template not found")
     try:
-        os.remove(path)
-    except Exception as e:
-        raise HTTPException(  # noqa: B904
-            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR, detail=f"Failed to delete template: {e!s}"
-        )
+        await run_in_threadpool(_delete_file, path, "template")
+    except HTTPException as e:
+        # Uploads that failed ingestion under a new name only exist in the index
+        entries = await run_in_threadpool(template_index.entries)
+        if e.status_code != status.HTTP_404_NOT_FOUND or filename not in entries:
+            raise
+    await run_in_threadpool(template_store.discard, path)
+    await run_in_threadpool(template_index.remove, filename)
+    await run_in_threadpool(publish_assets_changed)
     return {"ok": True}
 
 
 # ---------- Presets ----------
 @router.get("/api/presets", dependencies=[Depends(verify_api_key)])
-async def list_presets():
-    cfg = _load_config()
-    return {"items": cfg.get("presets", [])}
+async def list_presets(if_none_match: str | None = Header(None)):
+    state = await config_repo.snapshot()
+    return _conditional_json(state, if_none_match, {"items": state.raw.get("presets", [])})
 
 
 @router.post("/api/presets", dependencies=[Depends(verify_api_key)], status_code=status.HTTP_201_CREATED)
-async def add_preset(preset: Preset):
-    cfg = _load_config()
-    presets: list[dict[str, Any]] = cfg.get("presets", [])
-    if any(p.get("name") == preset.name for p in presets):
-        raise HTTPException(status_code=status.HTTP_409_CONFLICT, detail="Preset already exists")
-    presets.append(preset.model_dump())
-    cfg["presets"] = presets
-    _save_config(cfg)
-    return {"ok": True}
+async def add_preset(preset: Preset, response: Response, if_match: str | None = Header(None)):
+    def mutate(cfg: dict[str, Any]):
+        presets: list[dict[str, Any]] = cfg.setdefault("presets", [])
+        if any(p.get("name") == preset.name for p in presets):
+            raise HTTPException(status_code=status.HTTP_409_CONFLICT, detail="Preset already exists")
+        presets.append(preset.model_dump())
+
+    return await _modify_config(response, mutate, if_match)
 
 
 @router.put("/api/presets/{name}", dependencies=[Depends(verify_api_key)])
-async def update_preset(name: str, preset: Preset):
+async def update_preset(name: str, preset: Preset, response: Response, if_match: str | None = Header(None)):
     if name != preset.name:
         raise HTTPException(
             status_code=status.HTTP_400_BAD_REQUEST, detail="Renaming is not supported. Delete and add again."
         )
-    cfg = _load_config()
-    presets: list[dict[str, Any]] = cfg.get("presets", [])
-    for idx, p in enumerate(presets):
-        if p.get("name") == name:
-            presets[idx] = preset.model_dump()
-            cfg["presets"] = presets
-            _save_config(cfg)
-            return {"ok": True}
-    raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Preset not found")
+
+    def mutate(cfg: dict[str, Any]):
+        presets: list[dict[str, Any]] = cfg.get("presets", [])
+        for idx, p in enumerate(presets):
+            if p.get("name") == name:
+                presets[idx] = preset.model_dump()
+                return
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Preset not found")
+
+    return await _modify_config(response, mutate, if_match)
 
 
 @router.delete("/api/presets/{name}", dependencies=[Depends(verify_api_key)])
-async def delete_preset(name: str):
-    cfg = _load_config()
-    presets: list[dict[str, Any]] = cfg.get("presets", [])
-    new_presets = [p for p in presets if p.get("name") != name]
-    if len(new_presets) == len(presets):
-        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Preset not found")
-    cfg["presets"] = new_presets
-    _save_config(cfg)
-    return {"ok": True}
+async def delete_preset(name: str, response: Response, if_match: str | None = Header(None)):
+    def mutate(cfg: dict[str, Any]):
+        presets: list[dict[str, Any]] = cfg.get("presets", [])
+        new_presets = [p for p in presets if p.get("name") != name]
+        if len(new_presets) == len(presets):
+            raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Preset not found")
+        cfg["presets"] = new_presets
+
+    return await _modify_config(response, mutate, if_match)
+
+
+def _preview_etag(preset: Preset, template_path: str, scale: float | None, max_width: int | None) -> str | None:
+    font_paths = [os.path.join(settings.FONT_FOLDER, ti.font) for ti in preset.texts]
+    try:
+        key = render_key(preset.model_dump(), template_path, font_paths, {"preview": f"{scale}:{max_width}"})
+    except FileNotFoundError:
+        return None
+    return f'"{key}"'
 
 
 @router.post("/api/presets/preview", dependencies=[Depends(verify_api_key)])
-async def preview_preset(preset: Preset):
+async def preview_preset(
+    preset: Preset,
+    scale: float | None = Query(None, gt=0, le=1),
+    max_width: int | None = Query(None, ge=16),
+    if_none_match: str | None = Header(None),
+):
+    template_path = os.path.join(settings.TEMPLATE_FOLDER, preset.template)
+    etag = await run_in_threadpool(_preview_etag, preset, template_path, scale, max_width)
+    headers = {"ETag": etag, "Cache-Control": "private, no-cache"} if etag else {}
+    if etag is not None:
+        if etag_matches(if_none_match, etag):
+            return Response(status_code=status.HTTP_304_NOT_MODIFIED, headers=headers)
+        cached = _preview_cache.get(etag)
+        if cached is not None:
+            _preview_cache.move_to_end(etag)
+            return Response(content=cached, media_type="image/jpeg", headers=headers)
+
     preview_data = InvitationForm(
         type=preset.name,
         date="01.01.2026",
@@ -254,14 +346,34 @@ async def preview_preset(preset: Preset):
         address="пр. Энгельса, 100",
         email="-",
     )
-    template_path = os.path.join(settings.TEMPLATE_FOLDER, preset.template)
     try:
         texts_config = [ti.model_dump() for ti in preset.texts]
-        img_bytes = await run_in_threadpool(_gen_invitation_img, template_path, texts_config, preview_data)
+        img_bytes = await run_preview(
+            template_path, texts_config, preview_data, preset.output, scale=scale, max_width=max_width
+        )
     except FileNotFoundError as e:
         raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail=str(e))  # noqa: B904
     except Exception as e:
         raise HTTPException(  # noqa: B904
             status_code=status.HTTP_500_INTERNAL_SERVER_ERROR, detail=f"Failed to render preview: {e!s}"
         )
-    return Response(content=img_bytes, media_type="image/jpeg")
+
+    if etag is not None:
+        _preview_cache[etag] = img_bytes
+        while len(_preview_cache) > settings.PREVIEW_CACHE_ITEMS:
+            _preview_cache.popitem(last=False)
+    return Response(content=img_bytes, media_type="image/jpeg", headers=headers)
+
+
+# ---------- Profiles ----------
+@router.get("/api/profiles", dependencies=[Depends(verify_api_key)])
+async def get_profiles():
+    return {"items": await run_in_threadpool(list_profiles)}
+
+
+@router.get("/api/profiles/{profile_id}", dependencies=[Depends(verify_api_key)])
+async def download_profile(profile_id: str):
+    path = profile_path(_safe_filename(profile_id))
+    if not await run_in_threadpool(os.path.isfile, path):
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Profile not found")
+    return FileResponse(path, media_type="application/octet-stream", filename=os.path.basename(path))
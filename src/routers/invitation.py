@@ -1,8 +1,32 @@
-from fastapi import APIRouter, Depends, Form, HTTPException, Request, status
+import json
+from typing import Any
 
-from src.celery_app import celery_app
-from src.models.invitation import InvitationForm, InvitationResult
+import redis
+from celery.canvas import Signature
+from fastapi import APIRouter, Depends, Header, HTTPException, Query, Request, Response, status
+from fastapi.concurrency import run_in_threadpool
+from pydantic import ValidationError
+from starlette.datastructures import FormData
+
+from src.celery_app import celery_app, invitation_pipeline
+from src.config import settings
+from src.models.invitation import (
+    DeadLetterList,
+    DeadLetterReplayResult,
+    InvitationBatchItem,
+    InvitationBatchResult,
+    InvitationForm,
+    InvitationResult,
+)
 from src.utils.auth import verify_api_key
+from src.utils.config_store import config_store
+from src.utils.dead_letter import list_dead_letters, restore_dead_letters, take_dead_letters
+from src.utils.http_cache import etag_matches
+from src.utils.idempotency import claim_submission, form_fingerprint, idempotency_key, release_submission
+from src.utils.img_gen import plan_render
+from src.utils.profiling import tag_profile
+from src.utils.render_pool import render_pool
+from src.utils.task_publisher import task_publisher
 
 router = APIRouter(
     prefix="/invitation",
@@ -10,22 +34,22 @@ router = APIRouter(
 )
 
 
+def _form_value(form: FormData, key: str) -> str | None:
+    value = form.get(key)
+    return value if isinstance(value, str) else None
+
+
 @router.post("", response_model=InvitationResult | dict, dependencies=[Depends(verify_api_key)])
-async def gen_img_and_send_email(
-    request: Request,
-    type: str | None = Form(None),
-    date: str | None = Form(None),
-    time: str | None = Form(None),
-    city: str | None = Form(None),
-    email: str | None = Form(None),
-    test: str | None = Form(None),
-):
+async def gen_img_and_send_email(request: Request, response: Response):
     form = await request.form()
+    type, date, time, city, email, test = (
+        _form_value(form, key) for key in ("type", "date", "time", "city", "email", "test")
+    )
 
     address = None
     for key in form:
         if key.startswith("address"):
-            address = form[key]
+            address = _form_value(form, key)
             break
 
     if test == "test":
@@ -33,11 +57,192 @@ async def gen_img_and_send_email(
     elif all((type, date, time, address, email)):
         try:
             data = InvitationForm(type=type, date=date, time=time, city=city, address=address, email=email)
-            celery_app.send_task("generate_invitation_task", args=[data.model_dump()])
-            return InvitationResult(result="Invitation task created", invitation=data.type, email=data.email)
         except ValueError as e:
             raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=str(e))  # noqa: B904
-        except Exception as e:
-            raise HTTPException(status_code=status.HTTP_500_INTERNAL_SERVER_ERROR, detail=f"Internal server error: {str(e)}")  # noqa: B904
+        # In blob mode reading the snapshot may check Redis for a newer config
+        config = await run_in_threadpool(config_store.get)
+        if data.type not in config.presets:
+            raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="Preset not found")
+
+        tag_profile(preset=data.type)
+        invitation_data = data.model_dump()
+        fingerprint = form_fingerprint(invitation_data)
+        key = idempotency_key(request.headers.get("Idempotency-Key"), fingerprint)
+        result = InvitationResult(result="Invitation task created", invitation=data.type, email=data.email)
+        original = await claim_submission(key, fingerprint, result.model_dump())
+        if original is not None:
+            response.headers["Idempotent-Replayed"] = "true"
+            return InvitationResult.model_validate(original)
+
+        try:
+            await task_publisher.check_backpressure()
+            try:
+                await task_publisher.publish([invitation_pipeline(invitation_data, key)], endpoint="single")
+            except Exception as e:
+                raise HTTPException(  # noqa: B904
+                    status_code=status.HTTP_500_INTERNAL_SERVER_ERROR, detail=f"Internal server error: {e!s}"
+                )
+        except HTTPException:
+            # Nothing was queued, so the client's retry must not be answered as a duplicate
+            await release_submission(key)
+            raise
+        return result
     else:
         raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="Invalid data format")
+
+
+def _parse_batch_body(body: bytes, content_type: str) -> list[Any]:
+    if "ndjson" in content_type or "jsonl" in content_type:
+        records: list[Any] = []
+        for line in body.splitlines():
+            if not line.strip():
+                continue
+            try:
+                records.append(json.loads(line))
+            except json.JSONDecodeError as e:
+                records.append(e)
+        return records
+    try:
+        records = json.loads(body)
+    except json.JSONDecodeError as e:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=f"Invalid JSON: {e!s}")  # noqa: B904
+    if not isinstance(records, list):
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="Expected a JSON array of invitations")
+    return records
+
+
+def _validate_batch_item(record: Any, presets: dict[str, Any]) -> InvitationForm:
+    if isinstance(record, json.JSONDecodeError):
+        raise ValueError(f"Invalid JSON: {record!s}")
+    data = InvitationForm.model_validate(record)
+    if not all((data.type, data.date, data.time, data.address, data.email)):
+        raise ValueError("Invalid data format")
+    if data.type not in presets:
+        raise ValueError("Preset not found")
+    return data
+
+
+def _format_validation_error(e: ValidationError) -> str:
+    return "; ".join(f"{'.'.join(map(str, err['loc']))}: {err['msg']}" for err in e.errors())
+
+
+def _rejected_item(index: int, record: Any, error: str) -> InvitationBatchItem:
+    email = record.get("email") if isinstance(record, dict) else None
+    return InvitationBatchItem(
+        index=index, result="rejected", email=email if isinstance(email, str) else None, error=error
+    )
+
+
+def _batch_signatures(invitations: list[dict[str, Any]]) -> list[Signature]:
+    chunk_size = settings.INVITATION_BATCH_CHUNK_SIZE
+    return [
+        celery_app.signature("generate_invitation_batch_task", args=[invitations[start : start + chunk_size]])
+        for start in range(0, len(invitations), chunk_size)
+    ]
+
+
+@router.post("/batch", response_model=InvitationBatchResult, dependencies=[Depends(verify_api_key)])
+async def gen_img_and_send_email_batch(request: Request):
+    records = _parse_batch_body(await request.body(), request.headers.get("content-type", ""))
+    if len(records) > settings.INVITATION_BATCH_MAX_ITEMS:
+        raise HTTPException(
+            status_code=status.HTTP_413_REQUEST_ENTITY_TOO_LARGE,
+            detail=f"Batch exceeds {settings.INVITATION_BATCH_MAX_ITEMS} invitations",
+        )
+
+    presets = (await run_in_threadpool(config_store.get)).presets
+    items: list[InvitationBatchItem] = []
+    accepted: list[dict[str, Any]] = []
+    for index, record in enumerate(records):
+        try:
+            data = _validate_batch_item(record, presets)
+        except ValidationError as e:
+            items.append(_rejected_item(index, record, _format_validation_error(e)))
+        except ValueError as e:
+            items.append(_rejected_item(index, record, str(e)))
+        else:
+            accepted.append(data.model_dump())
+            items.append(InvitationBatchItem(index=index, result="accepted", email=data.email))
+
+    if accepted:
+        await task_publisher.check_backpressure()
+        try:
+            await task_publisher.publish(_batch_signatures(accepted), endpoint="batch")
+        except Exception as e:
+            raise HTTPException(  # noqa: B904
+                status_code=status.HTTP_500_INTERNAL_SERVER_ERROR, detail=f"Failed to enqueue invitations: {e!s}"
+            )
+    return InvitationBatchResult(accepted=len(accepted), rejected=len(items) - len(accepted), items=items)
+
+
+@router.get(
+    "/render",
+    response_class=Response,
+    responses={200: {"content": {"image/jpeg": {}}}},
+    dependencies=[Depends(verify_api_key)],
+)
+async def render_invitation_image(
+    preset: str = Query(..., min_length=1),
+    date: str = Query(..., min_length=1),
+    time: str = Query(..., min_length=1),
+    address: str = Query(..., min_length=1),
+    if_none_match: str | None = Header(None),
+):
+    tag_profile(preset=preset)
+    data = InvitationForm(type=preset, date=date, time=time, city="-", address=address, email="-")
+    try:
+        job = await run_in_threadpool(plan_render, data)
+    except ValueError as e:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail=str(e))  # noqa: B904
+    if job.key is None:
+        raise HTTPException(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR, detail="Template or font of the preset is missing"
+        )
+
+    # The key covers the preset, the template and font contents and the values, so the same ETag means the same bytes
+    etag = f'"{job.key}"'
+    headers = {"ETag": etag, "Cache-Control": f"private, max-age={settings.RENDER_HTTP_MAX_AGE}"}
+    if etag_matches(if_none_match, etag):
+        return Response(status_code=status.HTTP_304_NOT_MODIFIED, headers=headers)
+    try:
+        img_bytes = await render_pool.render(job.key, job, data)
+    except HTTPException:
+        raise
+    except Exception as e:
+        raise HTTPException(  # noqa: B904
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR, detail=f"Failed to render invitation: {e!s}"
+        )
+    return Response(content=img_bytes, media_type="image/jpeg", headers=headers)
+
+
+@router.get("/dead-letter", response_model=DeadLetterList, dependencies=[Depends(verify_api_key)])
+async def get_dead_letters(offset: int = Query(0, ge=0), limit: int = Query(100, ge=1, le=1000)):
+    try:
+        total, entries = await run_in_threadpool(list_dead_letters, offset, limit)
+    except redis.RedisError as e:
+        raise HTTPException(  # noqa: B904
+            status_code=status.HTTP_503_SERVICE_UNAVAILABLE, detail=f"Dead-letter queue is unavailable: {e!s}"
+        )
+    return DeadLetterList(total=total, items=entries)
+
+
+@router.post("/dead-letter/replay", response_model=DeadLetterReplayResult, dependencies=[Depends(verify_api_key)])
+async def replay_dead_letters(ids: list[str] | None = Query(None, alias="id")):  # noqa: B008
+    await task_publisher.check_backpressure()
+    try:
+        entries = await run_in_threadpool(take_dead_letters, set(ids) if ids else None)
+    except redis.RedisError as e:
+        raise HTTPException(  # noqa: B904
+            status_code=status.HTTP_503_SERVICE_UNAVAILABLE, detail=f"Dead-letter queue is unavailable: {e!s}"
+        )
+    if ids and not entries:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Dead-letter entries not found")
+
+    try:
+        await task_publisher.publish([invitation_pipeline(entry["invitation"]) for entry in entries], endpoint="replay")
+    except Exception as e:
+        await run_in_threadpool(restore_dead_letters, entries)
+        raise HTTPException(  # noqa: B904
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR, detail=f"Failed to enqueue invitations: {e!s}"
+        )
+    return DeadLetterReplayResult(replayed=len(entries), ids=[entry["id"] for entry in entries])
@@ -0,0 +1,14 @@
+from fastapi import APIRouter, Response
+from fastapi.concurrency import run_in_threadpool
+from prometheus_client import CONTENT_TYPE_LATEST, generate_latest
+
+from src.utils.metrics import metrics_registry
+
+router = APIRouter(tags=["Metrics"])
+
+
+@router.get("/metrics", include_in_schema=False)
+async def metrics():
+    # Collecting queue depth talks to Redis, so keep it off the event loop
+    body = await run_in_threadpool(generate_latest, metrics_registry())
+    return Response(content=body, media_type=CONTENT_TYPE_LATEST)
@@ -1,20 +1,121 @@
 import logging
+import time
 
-from src.celery_app import celery_app
+import redis
+from celery import Task
+from celery.exceptions import Ignore, SoftTimeLimitExceeded
+
+from src.celery_app import celery_app, invitation_pipeline
+from src.config import settings
 from src.models.invitation import InvitationForm
-from src.utils.img_gen import create_invitation
-from src.utils.mail import send_email_with_attachment
+from src.utils.dead_letter import push_dead_letter
+from src.utils.delivery import form_key, preset_label, retry_backoff
+from src.utils.idempotency import claim_delivery, release_delivery
+from src.utils.image_handoff import load_image, store_image
+from src.utils.img_gen import create_invitation, render_invitation
+from src.utils.mail import TransientDeliveryError, send_email_with_attachment
+from src.utils.metrics import INVITATIONS
+from src.utils.rate_limit import smtp_rate_limiter
 
 logger = logging.getLogger(__name__)
 
 
-@celery_app.task(name="generate_invitation_task")
-def generate_invitation_task(invitation_data: dict):
+def _render_failed(invitation_data: dict, error: Exception, attempts: int) -> Ignore:
+    INVITATIONS.labels(preset=preset_label(invitation_data), result="render_failed").inc()
+    logger.error("Failed to render invitation for %s: %s", invitation_data.get("email", "unknown"), str(error))
+    push_dead_letter(invitation_data, str(error), attempts)
+    # Ignore stops the chain: there is no image to deliver
+    return Ignore()
+
+
+@celery_app.task(name="render_invitation_task", bind=True, max_retries=None)
+def render_invitation_task(self: Task, invitation_data: dict) -> str:
+    try:
+        form = InvitationForm(**invitation_data)
+        image_key, img_bytes = render_invitation(form)
+        store_image(image_key, img_bytes)
+    except redis.RedisError:
+        # Redis is also the broker and the dead-letter store, so there is nowhere to park the invitation
+        INVITATIONS.labels(preset=preset_label(invitation_data), result="render_failed").inc()
+        raise
+    except SoftTimeLimitExceeded as e:
+        # A render cut short on the prefork pool points at an overloaded worker, not at the invitation
+        attempt = self.request.retries
+        if attempt >= settings.DELIVERY_MAX_RETRIES:
+            raise _render_failed(invitation_data, e, attempt + 1) from e
+        countdown = retry_backoff(attempt)
+        INVITATIONS.labels(preset=preset_label(invitation_data), result="retried").inc()
+        logger.warning("Render for %s hit the time limit, retrying in %.0fs",
+                       invitation_data.get("email", "unknown"), countdown)
+        raise self.retry(countdown=countdown) from e
+    except Exception as e:
+        # An unknown preset or a missing template or font fails the same way on every attempt
+        raise _render_failed(invitation_data, e, 1) from e
+    return image_key
+
+
+@celery_app.task(name="deliver_invitation_task", bind=True, max_retries=None)
+def deliver_invitation_task(
+    self: Task, image_key: str, invitation_data: dict, attempt: int = 0, idempotency_key: str | None = None
+):
+    if image_key is None:
+        # Eager chains keep going after an ignored render; the render has already dead-lettered the invitation
+        return
+    deadline = time.monotonic() + settings.DELIVERY_TIME_LIMIT
+    # Submissions without a key are deduplicated by their content, whichever endpoint they came through
+    dedup_key = idempotency_key or form_key(invitation_data)
+    if not claim_delivery(dedup_key, self.request.id):
+        INVITATIONS.labels(preset=preset_label(invitation_data), result="duplicate").inc()
+        logger.info("Skipping duplicate invitation for %s", invitation_data.get("email", "unknown"))
+        return
+
+    granted, wait = smtp_rate_limiter.reserve()
+    if not granted:
+        # The send slots for the next SMTP_RATE_MAX_WAIT seconds are taken; come back when ours frees up
+        raise self.retry(countdown=wait)
+    time.sleep(wait)
+
     try:
         form = InvitationForm(**invitation_data)
-        img_bytes = create_invitation(form)
-        send_email_with_attachment(form, img_bytes)
+        img_bytes = load_image(image_key)
+        if img_bytes is None:
+            # The handed-off image expired before delivery; render it again here
+            img_bytes = create_invitation(form)
+        send_email_with_attachment(form, img_bytes, deadline)
+        INVITATIONS.labels(preset=preset_label(invitation_data), result="sent").inc()
         logger.info(f"Invitation created and sent successfully for {form.email}")
+    except (TransientDeliveryError, SoftTimeLimitExceeded) as e:
+        # Nothing was sent, so a duplicate submitted meanwhile may go out instead of this one;
+        # SoftTimeLimitExceeded gets here when the prefork pool cuts a slow re-render short
+        release_delivery(dedup_key, self.request.id)
+        if attempt < settings.DELIVERY_MAX_RETRIES:
+            countdown = retry_backoff(attempt)
+            INVITATIONS.labels(preset=preset_label(invitation_data), result="retried").inc()
+            logger.warning("Delivery to %s failed, retrying in %.0fs: %s",
+                           invitation_data.get("email", "unknown"), countdown, str(e))
+            raise self.retry(  # noqa: B904
+                kwargs={"attempt": attempt + 1, "idempotency_key": idempotency_key}, countdown=countdown
+            )
+        INVITATIONS.labels(preset=preset_label(invitation_data), result="failed").inc()
+        logger.error("Giving up on invitation for %s after %d attempts: %s",
+                     invitation_data.get("email", "unknown"), attempt + 1, str(e))
+        push_dead_letter(invitation_data, str(e), attempt + 1)
     except Exception as e:
+        release_delivery(dedup_key, self.request.id)
+        INVITATIONS.labels(preset=preset_label(invitation_data), result="failed").inc()
         logger.error("Failed to create invitation for %s: %s",
                     invitation_data.get("email", "unknown"), str(e))
+        push_dead_letter(invitation_data, str(e), attempt + 1)
+
+
+@celery_app.task(name="generate_invitation_task")
+def generate_invitation_task(invitation_data: dict):
+    # Kept for messages published before the render/deliver split
+    invitation_pipeline(invitation_data).apply_async()
+
+
+@celery_app.task(name="generate_invitation_batch_task")
+def generate_invitation_batch_task(invitations: list[dict]):
+    with celery_app.producer_or_acquire() as producer:
+        for invitation_data in invitations:
+            invitation_pipeline(invitation_data).apply_async(producer=producer)
@@ -0,0 +1,177 @@
+import contextlib
+import json
+import logging
+import os
+import tempfile
+import threading
+import time
+from typing import Any
+
+import redis
+
+from src.config import settings
+from src.utils.blob_store import BlobStore, blob_digest, blob_store
+from src.utils.render_cache import file_digest
+from src.utils.template_store import template_store
+
+logger = logging.getLogger(__name__)
+
+MANIFEST_REF = "manifest"
+
+_KINDS = {"templates": "Template image", "fonts": "Font"}
+_PRUNE_AFTER = 3600
+
+_publish_lock = threading.Lock()
+
+
+def _require_store() -> BlobStore:
+    if blob_store is None:
+        raise RuntimeError("ASSET_SOURCE=blob needs BLOB_STORE to be set")
+    return blob_store
+
+
+def _scan_folder(folder: str) -> dict[str, str]:
+    try:
+        names = sorted(os.listdir(folder))
+    except FileNotFoundError:
+        return {}
+    # Dotfiles are in-progress uploads and other internal state
+    return {
+        name: file_digest(os.path.join(folder, name))
+        for name in names
+        if not name.startswith(".") and os.path.isfile(os.path.join(folder, name))
+    }
+
+
+def _manifest_digests(manifest: dict[str, Any]) -> set[str]:
+    return {manifest["config"], *(digest for kind in _KINDS for digest in manifest[kind].values())}
+
+
+def _publish(store: BlobStore) -> bool:
+    manifest = {
+        "config": file_digest(settings.CONFIG_PATH),
+        "templates": _scan_folder(settings.TEMPLATE_FOLDER),
+        "fonts": _scan_folder(settings.FONT_FOLDER),
+    }
+    paths = {manifest["config"]: settings.CONFIG_PATH}
+    for kind, folder in (("templates", settings.TEMPLATE_FOLDER), ("fonts", settings.FONT_FOLDER)):
+        paths.update({digest: os.path.join(folder, name) for name, digest in manifest[kind].items()})
+
+    for digest in store.missing(paths):
+        with open(paths[digest], "rb") as file:
+            stored = store.put(file.read())
+        if stored != digest:
+            # The file changed while we were publishing; whoever changed it publishes again
+            logger.info("Skipping asset publish, %s changed underneath it", paths[digest])
+            return False
+    store.retain(paths)
+
+    manifest_digest = store.put(json.dumps(manifest, sort_keys=True, ensure_ascii=False).encode("utf-8"))
+    previous = store.get_ref(MANIFEST_REF)
+    if previous == manifest_digest:
+        return False
+    store.set_ref(MANIFEST_REF, manifest_digest)
+    logger.info("Published asset manifest %s", manifest_digest)
+
+    if previous is not None and (raw := store.get(previous)) is not None:
+        store.release((_manifest_digests(json.loads(raw)) | {previous}) - set(paths) - {manifest_digest})
+    return True
+
+
+def publish_assets() -> bool:
+    if blob_store is None:
+        return False
+    with _publish_lock:
+        try:
+            return _publish(blob_store)
+        except (OSError, redis.RedisError) as e:
+            logger.warning("Failed to publish assets to the blob store: %s", e)
+            return False
+
+
+class AssetCache:
+    def __init__(self, folder: str):
+        self.folder = folder
+        self._current: tuple[str, dict[str, Any]] | None = None
+
+    def refresh(self) -> dict[str, Any]:
+        digest = _require_store().get_ref(MANIFEST_REF)
+        if digest is None:
+            raise FileNotFoundError("Asset manifest has not been published yet")
+        current = self._current
+        if current is None or current[0] != digest:
+            with open(self.blob_path(digest), encoding="utf-8") as file:
+                current = (digest, json.load(file))
+            self._current = current
+        return current[1]
+
+    def manifest(self) -> dict[str, Any]:
+        current = self._current
+        return current[1] if current is not None else self.refresh()
+
+    def blob_path(self, digest: str) -> str:
+        path = os.path.join(self.folder, digest[:2], digest)
+        if os.path.exists(path):
+            return path
+
+        data = _require_store().get(digest)
+        if data is None:
+            raise FileNotFoundError("Blob not found: " + digest)
+        if blob_digest(data) != digest:
+            raise ValueError("Blob failed verification: " + digest)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(path), suffix=".tmp")
+        try:
+            with os.fdopen(fd, "wb") as file:
+                file.write(data)
+            os.replace(tmp_path, path)
+        except BaseException:
+            with contextlib.suppress(FileNotFoundError):
+                os.remove(tmp_path)
+            raise
+        return path
+
+    def path(self, kind: str, name: str) -> str:
+        digest = self.manifest()[kind].get(name)
+        if digest is None:
+            raise FileNotFoundError(f"{_KINDS[kind]} not found: {name}")
+        return self.blob_path(digest)
+
+    def prefetch(self):
+        started = time.monotonic()
+        manifest = self.refresh()
+        wanted = _manifest_digests(manifest) | {self._current[0]}
+        for digest in wanted:
+            try:
+                self.blob_path(digest)
+            except (OSError, ValueError, redis.RedisError) as e:
+                logger.warning("Failed to prefetch blob %s: %s", digest, e)
+        self._prune(wanted)
+        logger.info("Prefetched %d assets in %.2fs", len(wanted), time.monotonic() - started)
+
+    def prefetch_quietly(self):
+        try:
+            self.prefetch()
+        except Exception as e:
+            logger.warning("Asset prefetch failed: %s", e)
+
+    def _prune(self, keep: set[str]):
+        # Renders that resolved an older manifest may still be reading its blobs, so only long-unused ones go
+        now = time.time()
+        for root, _, files in os.walk(self.folder):
+            for name in files:
+                path = os.path.join(root, name)
+                with contextlib.suppress(FileNotFoundError):
+                    if name not in keep and now - os.stat(path).st_mtime >= _PRUNE_AFTER:
+                        os.remove(path)
+                        # Templates are decoded into the template store under their blob path
+                        template_store.discard(path)
+
+
+def asset_path(kind: str, name: str) -> str:
+    if settings.ASSET_SOURCE == "blob":
+        return asset_cache.path(kind, name)
+    return os.path.join(settings.TEMPLATE_FOLDER if kind == "templates" else settings.FONT_FOLDER, name)
+
+
+asset_cache = AssetCache(settings.ASSET_CACHE_DIR)
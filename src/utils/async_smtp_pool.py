@@ -0,0 +1,121 @@
+import asyncio
+import contextlib
+import time
+from collections import deque
+
+import aiosmtplib
+
+from src.config import settings
+from src.utils.metrics import stage_timer
+
+_MESSAGE_ERRORS = (aiosmtplib.SMTPRecipientsRefused, aiosmtplib.SMTPSenderRefused, aiosmtplib.SMTPDataError)
+
+
+class _AsyncSession:
+    def __init__(self, conn: aiosmtplib.SMTP):
+        self.conn = conn
+        self.created_at = time.monotonic()
+        self.last_used = self.created_at
+        self.uses = 0
+
+    def expired(self) -> bool:
+        return (
+            self.uses >= settings.SMTP_SESSION_MAX_MESSAGES
+            or time.monotonic() - self.created_at >= settings.SMTP_SESSION_MAX_AGE
+        )
+
+    async def alive(self) -> bool:
+        if not self.conn.is_connected:
+            return False
+        if time.monotonic() - self.last_used < settings.SMTP_NOOP_INTERVAL:
+            return True
+        try:
+            return (await self.conn.noop()).code == 250  # noqa: PLR2004
+        except (aiosmtplib.SMTPException, OSError):
+            return False
+
+    async def close(self):
+        try:
+            await self.conn.quit()
+        except (aiosmtplib.SMTPException, OSError):
+            self.conn.close()
+
+
+class AsyncSMTPPool:
+    def __init__(self, size: int):
+        self.size = size
+        self._idle: deque[_AsyncSession] = deque()
+        # A session carries one transaction at a time, so this also caps the messages in flight to the server
+        self._slots = asyncio.Semaphore(size)
+
+    async def _connect(self) -> _AsyncSession:
+        conn = aiosmtplib.SMTP(
+            hostname=settings.SMTP_SERVER,
+            port=settings.SMTP_PORT,
+            use_tls=settings.SMTP_SSL,
+            start_tls=False,
+            timeout=settings.SMTP_TIMEOUT,
+        )
+        with stage_timer("smtp_connect"):
+            await conn.connect()
+        try:
+            with stage_timer("smtp_login"):
+                await conn.login(settings.SMTP_USER, settings.SMTP_PASSWORD)
+        except BaseException:
+            conn.close()
+            raise
+        return _AsyncSession(conn)
+
+    async def _acquire(self) -> _AsyncSession:
+        while self._idle:
+            session = self._idle.pop()
+            if not session.expired() and await session.alive():
+                return session
+            await session.close()
+        return await self._connect()
+
+    async def _release(self, session: _AsyncSession):
+        session.last_used = time.monotonic()
+        if len(self._idle) < self.size and not session.expired():
+            self._idle.append(session)
+            return
+        await session.close()
+
+    async def _send(self, session: _AsyncSession, from_addr: str, to_addr: str, msg: bytes):
+        session.uses += 1
+        try:
+            with stage_timer("smtp_send"):
+                await session.conn.sendmail(from_addr, to_addr, msg)
+        except aiosmtplib.SMTPServerDisconnected:
+            session.conn.close()
+            raise
+        except _MESSAGE_ERRORS:
+            # The server rejected this message but the session itself is still usable
+            await self._release(session)
+            raise
+        except BaseException:
+            session.conn.close()
+            raise
+        await self._release(session)
+
+    async def sendmail(self, from_addr: str, to_addr: str, msg: bytes):
+        async with self._slots:
+            session = await self._acquire()
+            reused = session.uses > 0
+            try:
+                await self._send(session, from_addr, to_addr, msg)
+            except aiosmtplib.SMTPServerDisconnected:
+                if not reused:
+                    raise
+                # The server dropped an idle session between the liveness check and the send; retry on a fresh one
+                await self._send(await self._connect(), from_addr, to_addr, msg)
+
+    async def close_all(self):
+        sessions = list(self._idle)
+        self._idle.clear()
+        for session in sessions:
+            with contextlib.suppress(Exception):
+                await session.close()
+
+
+async_smtp_pool = AsyncSMTPPool(settings.DELIVERY_SMTP_CONNECTIONS)
@@ -0,0 +1,163 @@
+import contextlib
+import hashlib
+import os
+import tempfile
+import time
+from collections.abc import Iterable
+from typing import Protocol
+
+from src.config import settings
+from src.utils.redis_client import get_redis
+
+BLOB_KEY_PREFIX = "img-invitation:blob:"
+REF_KEY_PREFIX = "img-invitation:ref:"
+
+# Blobs dropped from the manifest stay readable this long for nodes that haven't picked up the new one yet
+_RELEASE_GRACE = 24 * 3600
+
+
+def blob_digest(data: bytes) -> str:
+    return hashlib.sha256(data).hexdigest()
+
+
+class BlobStore(Protocol):
+    def put(self, data: bytes) -> str: ...
+
+    def get(self, digest: str) -> bytes | None: ...
+
+    def missing(self, digests: Iterable[str]) -> set[str]: ...
+
+    def retain(self, digests: Iterable[str]): ...
+
+    def release(self, digests: Iterable[str]): ...
+
+    def get_ref(self, name: str) -> str | None: ...
+
+    def set_ref(self, name: str, digest: str): ...
+
+
+class RedisBlobStore:
+    def put(self, data: bytes) -> str:
+        digest = blob_digest(data)
+        with get_redis().pipeline() as pipe:
+            pipe.set(BLOB_KEY_PREFIX + digest, data, nx=True)
+            pipe.persist(BLOB_KEY_PREFIX + digest)
+            pipe.execute()
+        return digest
+
+    def get(self, digest: str) -> bytes | None:
+        return get_redis().get(BLOB_KEY_PREFIX + digest)
+
+    def missing(self, digests: Iterable[str]) -> set[str]:
+        digests = list(digests)
+        with get_redis().pipeline(transaction=False) as pipe:
+            for digest in digests:
+                pipe.exists(BLOB_KEY_PREFIX + digest)
+            return {digest for digest, exists in zip(digests, pipe.execute(), strict=True) if not exists}
+
+    def retain(self, digests: Iterable[str]):
+        with get_redis().pipeline(transaction=False) as pipe:
+            for digest in digests:
+                pipe.persist(BLOB_KEY_PREFIX + digest)
+            pipe.execute()
+
+    def release(self, digests: Iterable[str]):
+        with get_redis().pipeline(transaction=False) as pipe:
+            for digest in digests:
+                pipe.expire(BLOB_KEY_PREFIX + digest, _RELEASE_GRACE)
+            pipe.execute()
+
+    def get_ref(self, name: str) -> str | None:
+        digest = get_redis().get(REF_KEY_PREFIX + name)
+        return digest.decode() if digest is not None else None
+
+    def set_ref(self, name: str, digest: str):
+        get_redis().set(REF_KEY_PREFIX + name, digest)
+
+
+class LocalBlobStore:
+    def __init__(self, folder: str):
+        self.folder = folder
+
+    def _path(self, digest: str) -> str:
+        return os.path.join(self.folder, digest[:2], digest)
+
+    def _released_path(self, digest: str) -> str:
+        return os.path.join(self.folder, "released", digest)
+
+    def _write(self, path: str, data: bytes):
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(path), suffix=".tmp")
+        try:
+            with os.fdopen(fd, "wb") as file:
+                file.write(data)
+            os.replace(tmp_path, path)
+        except BaseException:
+            with contextlib.suppress(FileNotFoundError):
+                os.remove(tmp_path)
+            raise
+
+    def put(self, data: bytes) -> str:
+        digest = blob_digest(data)
+        path = self._path(digest)
+        if not os.path.exists(path):
+            self._write(path, data)
+        self.retain([digest])
+        return digest
+
+    def get(self, digest: str) -> bytes | None:
+        try:
+            with open(self._path(digest), "rb") as file:
+                return file.read()
+        except FileNotFoundError:
+            return None
+
+    def missing(self, digests: Iterable[str]) -> set[str]:
+        return {digest for digest in digests if not os.path.exists(self._path(digest))}
+
+    def retain(self, digests: Iterable[str]):
+        for digest in digests:
+            with contextlib.suppress(FileNotFoundError):
+                os.remove(self._released_path(digest))
+
+    def release(self, digests: Iterable[str]):
+        # A marker's mtime is its release time; the blob itself goes once the grace has passed, as with Redis' EXPIRE
+        os.makedirs(os.path.join(self.folder, "released"), exist_ok=True)
+        for digest in digests:
+            if os.path.exists(self._path(digest)):
+                marker = self._released_path(digest)
+                open(marker, "a").close()
+                os.utime(marker)
+        self._prune_released()
+
+    def _prune_released(self):
+        cutoff = time.time() - _RELEASE_GRACE
+        for digest in os.listdir(os.path.join(self.folder, "released")):
+            marker = self._released_path(digest)
+            with contextlib.suppress(FileNotFoundError):
+                if os.stat(marker).st_mtime >= cutoff:
+                    continue
+                with contextlib.suppress(FileNotFoundError):
+                    os.remove(self._path(digest))
+                os.remove(marker)
+
+    def get_ref(self, name: str) -> str | None:
+        try:
+            with open(os.path.join(self.folder, "refs", name), encoding="ascii") as file:
+                return file.read().strip()
+        except FileNotFoundError:
+            return None
+
+    def set_ref(self, name: str, digest: str):
+        self._write(os.path.join(self.folder, "refs", name), digest.encode("ascii"))
+
+
+def _create_blob_store() -> BlobStore | None:
+    if settings.BLOB_STORE == "redis":
+        return RedisBlobStore()
+    if settings.BLOB_STORE == "local":
+        return LocalBlobStore(settings.BLOB_STORE_DIR)
+    return None
+
+
+blob_store = _create_blob_store()
@@ -0,0 +1,143 @@
+import asyncio
+import contextlib
+import copy
+import hashlib
+import json
+import os
+import tempfile
+import time
+from collections.abc import Callable
+from typing import Any
+
+from fastapi import HTTPException, status
+from fastapi.concurrency import run_in_threadpool
+
+from src.config import settings
+from src.utils.assets import publish_assets
+from src.utils.config_store import publish_config_changed
+from src.utils.http_cache import etag_matches
+
+
+class ConfigState:
+    def __init__(self, raw: dict[str, Any], version: int):
+        self.raw = raw
+        self.version = version
+        self.text = json.dumps(raw, ensure_ascii=False, indent=4)
+        self.etag = '"' + hashlib.sha256(self.text.encode("utf-8")).hexdigest()[:32] + '"'
+        self.presets: dict[str, dict[str, Any]] = {p.get("name"): p for p in raw.get("presets", [])}
+
+        phones = raw.get("city2phone", {})
+        emails = raw.get("city2email", {})
+        vks = raw.get("city2vk", {})
+        self.cities: dict[str, dict[str, Any]] = {
+            name: {"name": name, "phone": phones.get(name), "email": emails.get(name), "vk": vks.get(name)}
+            for name in sorted(set(phones) | set(emails) | set(vks))
+        }
+
+
+def _read_config(path: str) -> tuple[dict[str, Any], tuple[int, int]]:
+    try:
+        with open(path, encoding="utf-8") as f:
+            st = os.fstat(f.fileno())
+            return json.load(f), (st.st_mtime_ns, st.st_size)
+    except FileNotFoundError:
+        raise HTTPException(status_code=status.HTTP_500_INTERNAL_SERVER_ERROR, detail="Config file not found")  # noqa: B904
+    except json.JSONDecodeError as e:
+        raise HTTPException(status_code=status.HTTP_500_INTERNAL_SERVER_ERROR, detail=f"Invalid config.json: {e!s}")  # noqa: B904
+
+
+def _write_config(path: str, text: str) -> tuple[int, int]:
+    fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(os.path.abspath(path)), prefix=".config-", suffix=".tmp")
+    try:
+        with os.fdopen(fd, "w", encoding="utf-8") as f:
+            f.write(text)
+        os.chmod(tmp_path, 0o644)
+        os.replace(tmp_path, path)
+    except BaseException:
+        with contextlib.suppress(FileNotFoundError):
+            os.remove(tmp_path)
+        raise
+    st = os.stat(path)
+    publish_assets()
+    publish_config_changed()
+    return st.st_mtime_ns, st.st_size
+
+
+def _file_stamp(path: str) -> tuple[int, int] | None:
+    try:
+        st = os.stat(path)
+    except FileNotFoundError:
+        return None
+    return st.st_mtime_ns, st.st_size
+
+
+class ConfigRepository:
+    def __init__(self, path: str):
+        self.path = path
+        self._state: ConfigState | None = None
+        self._stamp: tuple[int, int] | None = None
+        self._version = 0
+        self._checked_at = 0.0
+        self._lock = asyncio.Lock()
+        self._pending_flush: asyncio.Future | None = None
+
+    async def snapshot(self) -> ConfigState:
+        if self._state is not None and time.monotonic() - self._checked_at < settings.CONFIG_RELOAD_INTERVAL:
+            return self._state
+        async with self._lock:
+            return await self._refresh()
+
+    async def modify(self, mutate: Callable[[dict[str, Any]], None], if_match: str | None = None) -> ConfigState:
+        async with self._lock:
+            state = await self._refresh()
+            if if_match is not None and not etag_matches(if_match, state.etag):
+                raise HTTPException(
+                    status_code=status.HTTP_412_PRECONDITION_FAILED, detail="Config was modified by someone else"
+                )
+            raw = copy.deepcopy(state.raw)
+            mutate(raw)
+            self._version += 1
+            self._state = ConfigState(raw, self._version)
+            flush = self._schedule_flush()
+            new_state = self._state
+        await asyncio.shield(flush)
+        return new_state
+
+    async def _refresh(self) -> ConfigState:
+        # Our own unflushed edits are newer than whatever is on disk
+        if self._state is not None and self._pending_flush is not None:
+            return self._state
+        stamp = await run_in_threadpool(_file_stamp, self.path)
+        self._checked_at = time.monotonic()
+        if self._state is None or stamp is None or stamp != self._stamp:
+            raw, self._stamp = await run_in_threadpool(_read_config, self.path)
+            self._version += 1
+            self._state = ConfigState(raw, self._version)
+        return self._state
+
+    def _schedule_flush(self) -> asyncio.Future:
+        if self._pending_flush is None:
+            loop = asyncio.get_running_loop()
+            self._pending_flush = loop.create_future()
+            loop.call_later(settings.CONFIG_FLUSH_DELAY, lambda: asyncio.ensure_future(self._flush()))
+        return self._pending_flush
+
+    async def _flush(self):
+        async with self._lock:
+            future, self._pending_flush = self._pending_flush, None
+            text = self._state.text
+            try:
+                self._stamp = await run_in_threadpool(_write_config, self.path, text)
+            except Exception as e:
+                # Drop the in-memory edits so the next request re-reads what is actually on disk
+                self._state = None
+                future.set_exception(
+                    HTTPException(
+                        status_code=status.HTTP_500_INTERNAL_SERVER_ERROR, detail=f"Failed to save config: {e!s}"
+                    )
+                )
+            else:
+                future.set_result(None)
+
+
+config_repo = ConfigRepository(settings.CONFIG_PATH)
@@ -0,0 +1,139 @@
+import json
+import logging
+import os
+import threading
+import time
+from collections.abc import Callable
+from typing import Any, NamedTuple
+
+import redis
+
+from src.config import settings
+from src.utils.assets import asset_cache, publish_assets
+from src.utils.metrics import stage_timer
+from src.utils.redis_client import get_redis
+
+logger = logging.getLogger(__name__)
+
+CONFIG_CHANNEL = "img-invitation:config-changed"
+
+
+class CityContacts(NamedTuple):
+    phone: str | None
+    email: str | None
+    vk: str | None
+
+
+class ConfigSnapshot:
+    def __init__(self, raw: dict[str, Any], stamp: tuple[int, int] | str):
+        self.raw = raw
+        self.stamp = stamp
+        self.presets: dict[str, dict[str, Any]] = {p["name"]: p for p in raw.get("presets", [])}
+
+        phones = raw.get("city2phone", {})
+        emails = raw.get("city2email", {})
+        vks = raw.get("city2vk", {})
+        self.cities: dict[str, CityContacts] = {
+            name: CityContacts(phones.get(name), emails.get(name), vks.get(name))
+            for name in set(phones) | set(emails) | set(vks)
+        }
+
+
+class ConfigStore:
+    def __init__(self, path: str, check_interval: float):
+        self.path = path
+        self.check_interval = check_interval
+        self._snapshot: ConfigSnapshot | None = None
+        self._checked_at = 0.0
+        self._stale = True
+        self._lock = threading.Lock()
+        self._listener: threading.Thread | None = None
+
+    def get(self) -> ConfigSnapshot:
+        snapshot = self._snapshot
+        if snapshot is not None and not self._stale and time.monotonic() - self._checked_at < self.check_interval:
+            return snapshot
+        with self._lock:
+            return self._refresh()
+
+    def invalidate(self):
+        self._stale = True
+
+    def _current_stamp(self) -> tuple[int, int] | str:
+        if settings.ASSET_SOURCE == "blob":
+            try:
+                return asset_cache.refresh()["config"]
+            except redis.RedisError as e:
+                if self._snapshot is None:
+                    raise
+                logger.warning("Failed to check the asset manifest, keeping previous config: %s", e)
+                return self._snapshot.stamp
+        try:
+            st = os.stat(self.path)
+        except FileNotFoundError as e:
+            raise FileNotFoundError("Config file not found: " + str(e))  # noqa: B904
+        return st.st_mtime_ns, st.st_size
+
+    def _refresh(self) -> ConfigSnapshot:
+        stamp = self._current_stamp()
+
+        self._stale = False
+        self._checked_at = time.monotonic()
+        if self._snapshot is not None and self._snapshot.stamp == stamp:
+            return self._snapshot
+
+        try:
+            # In blob mode the stamp is the digest of the published config
+            path = asset_cache.blob_path(stamp) if isinstance(stamp, str) else self.path
+            with stage_timer("config_load"), open(path, encoding="utf-8") as file:
+                raw = json.load(file)
+        except json.JSONDecodeError as e:
+            if self._snapshot is None:
+                raise
+            # The editor may be halfway through writing the file; keep serving the last good config
+            logger.warning("Failed to reload config, keeping previous version: %s", e)
+            self._stale = True
+            return self._snapshot
+
+        self._snapshot = ConfigSnapshot(raw, stamp)
+        return self._snapshot
+
+    def start_listener(self):
+        if self._listener is not None and self._listener.is_alive():
+            return
+        self._listener = threading.Thread(target=self._listen, name="config-listener", daemon=True)
+        self._listener.start()
+
+    def _listen(self):
+        listen_config_changes(self.invalidate, self.check_interval)
+
+
+def listen_config_changes(callback: Callable[[], None], retry_interval: float):
+    client = get_redis()
+    while True:
+        try:
+            pubsub = client.pubsub(ignore_subscribe_messages=True)
+            pubsub.subscribe(CONFIG_CHANNEL)
+            # Anything published while we were disconnected is lost, so act unconditionally
+            callback()
+            for _ in pubsub.listen():
+                callback()
+        except redis.RedisError as e:
+            logger.warning("Config change listener disconnected: %s", e)
+            time.sleep(retry_interval)
+
+
+def publish_config_changed():
+    config_store.invalidate()
+    try:
+        get_redis().publish(CONFIG_CHANNEL, str(time.time()))
+    except redis.RedisError as e:
+        logger.warning("Failed to publish config invalidation: %s", e)
+
+
+def publish_assets_changed():
+    if publish_assets():
+        publish_config_changed()
+
+
+config_store = ConfigStore(settings.CONFIG_PATH, settings.CONFIG_RELOAD_INTERVAL)
@@ -0,0 +1,55 @@
+import json
+import logging
+import time
+import uuid
+from typing import Any
+
+import redis
+
+from src.config import settings
+from src.utils.redis_client import get_redis
+
+logger = logging.getLogger(__name__)
+
+DEAD_LETTER_KEY = "img-invitation:dead-letter"
+
+
+def push_dead_letter(invitation_data: dict[str, Any], error: str, attempts: int):
+    entry = {
+        "id": uuid.uuid4().hex,
+        "invitation": invitation_data,
+        "error": error,
+        "attempts": attempts,
+        "failed_at": time.time(),
+    }
+    try:
+        with get_redis().pipeline() as pipe:
+            pipe.lpush(DEAD_LETTER_KEY, json.dumps(entry, ensure_ascii=False))
+            pipe.ltrim(DEAD_LETTER_KEY, 0, settings.DEAD_LETTER_MAX_ITEMS - 1)
+            pipe.execute()
+    except redis.RedisError as e:
+        logger.error("Failed to dead-letter invitation for %s: %s", invitation_data.get("email", "unknown"), e)
+
+
+def list_dead_letters(offset: int, limit: int) -> tuple[int, list[dict[str, Any]]]:
+    with get_redis().pipeline() as pipe:
+        pipe.llen(DEAD_LETTER_KEY)
+        pipe.lrange(DEAD_LETTER_KEY, offset, offset + limit - 1)
+        total, raw_entries = pipe.execute()
+    return total, [json.loads(raw) for raw in raw_entries]
+
+
+def take_dead_letters(ids: set[str] | None) -> list[dict[str, Any]]:
+    client = get_redis()
+    taken = []
+    for raw in client.lrange(DEAD_LETTER_KEY, 0, -1):
+        entry = json.loads(raw)
+        # LREM decides who gets an entry when two replays race, so nothing is published twice
+        if (ids is None or entry["id"] in ids) and client.lrem(DEAD_LETTER_KEY, 1, raw):
+            taken.append(entry)
+    return taken
+
+
+def restore_dead_letters(entries: list[dict[str, Any]]):
+    if entries:
+        get_redis().rpush(DEAD_LETTER_KEY, *(json.dumps(entry, ensure_ascii=False) for entry in entries))
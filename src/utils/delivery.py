@@ -0,0 +1,24 @@
+import random
+
+from src.config import settings
+from src.utils.config_store import config_store
+from src.utils.idempotency import form_fingerprint, idempotency_key
+
+
+def preset_label(invitation_data: dict) -> str:
+    # Unknown preset names come straight from the request; keep them out of the label set
+    preset = invitation_data.get("type")
+    try:
+        return preset if preset in config_store.get().presets else "unknown"
+    except Exception:
+        return "unknown"
+
+
+def retry_backoff(attempt: int) -> float:
+    # Half fixed, half random: retries still back off exponentially but workers that failed together spread out
+    delay = min(settings.DELIVERY_RETRY_BACKOFF_MAX, settings.DELIVERY_RETRY_BACKOFF * 2**attempt)
+    return delay / 2 + random.uniform(0, delay / 2)
+
+
+def form_key(invitation_data: dict) -> str:
+    return idempotency_key(None, form_fingerprint(invitation_data))
@@ -0,0 +1,91 @@
+import hashlib
+import json
+import logging
+from typing import Any
+
+import redis
+from fastapi import HTTPException, status
+
+from src.config import settings
+from src.utils.redis_client import get_async_redis, get_redis
+
+logger = logging.getLogger(__name__)
+
+SUBMISSION_KEY_PREFIX = "img-invitation:idempotency:"
+DELIVERY_KEY_PREFIX = "img-invitation:delivered:"
+
+_FINGERPRINT_FIELDS = ("type", "date", "time", "city", "address", "email")
+
+_RELEASE_SCRIPT = """
+if redis.call('GET', KEYS[1]) == ARGV[1] then
+    return redis.call('DEL', KEYS[1])
+end
+return 0
+"""
+
+_release_script: redis.commands.core.Script | None = None
+
+
+def form_fingerprint(invitation_data: dict[str, Any]) -> str:
+    # Whitespace and e-mail case differences are how retyped or re-posted forms usually differ
+    normalized = {field: " ".join(str(invitation_data.get(field) or "").split()) for field in _FINGERPRINT_FIELDS}
+    normalized["email"] = normalized["email"].casefold()
+    return hashlib.sha256(json.dumps(normalized, sort_keys=True, ensure_ascii=False).encode("utf-8")).hexdigest()
+
+
+def idempotency_key(header_value: str | None, fingerprint: str) -> str:
+    if header_value:
+        return "key:" + hashlib.sha256(header_value.encode("utf-8")).hexdigest()
+    return "form:" + fingerprint
+
+
+def _ttl(key: str) -> int:
+    return settings.IDEMPOTENCY_KEY_TTL if key.startswith("key:") else settings.IDEMPOTENCY_WINDOW
+
+
+async def claim_submission(key: str, fingerprint: str, response: dict[str, Any]) -> dict[str, Any] | None:
+    record = json.dumps({"fingerprint": fingerprint, "response": response}, ensure_ascii=False)
+    try:
+        previous = await get_async_redis().set(SUBMISSION_KEY_PREFIX + key, record, nx=True, get=True, ex=_ttl(key))
+    except redis.RedisError as e:
+        # Delivery checks again, so a duplicate let through here is still not mailed twice
+        logger.warning("Idempotency check unavailable, accepting submission: %s", e)
+        return None
+    if previous is None:
+        return None
+
+    stored = json.loads(previous)
+    if stored["fingerprint"] != fingerprint:
+        raise HTTPException(
+            status_code=status.HTTP_422_UNPROCESSABLE_ENTITY,
+            detail="Idempotency-Key was already used for a different invitation",
+        )
+    return stored["response"]
+
+
+async def release_submission(key: str):
+    try:
+        await get_async_redis().delete(SUBMISSION_KEY_PREFIX + key)
+    except redis.RedisError as e:
+        logger.warning("Failed to release idempotency key: %s", e)
+
+
+def claim_delivery(key: str, owner: str) -> bool:
+    try:
+        previous = get_redis().set(DELIVERY_KEY_PREFIX + key, owner, nx=True, get=True, ex=_ttl(key))
+    except redis.RedisError as e:
+        logger.warning("Delivery deduplication unavailable, sending anyway: %s", e)
+        return True
+    # Retries and redeliveries of the same task keep its id and may go on
+    return previous is None or previous.decode() == owner
+
+
+def release_delivery(key: str, owner: str):
+    global _release_script  # noqa: PLW0603
+    client = get_redis()
+    if _release_script is None:
+        _release_script = client.register_script(_RELEASE_SCRIPT)
+    try:
+        _release_script(keys=[DELIVERY_KEY_PREFIX + key], args=[owner], client=client)
+    except redis.RedisError as e:
+        logger.warning("Failed to release delivery claim: %s", e)
@@ -0,0 +1,15 @@
+from src.config import settings
+from src.utils.redis_client import get_redis
+
+REDIS_KEY_PREFIX = "img-invitation:handoff:"
+
+
+def store_image(key: str, data: bytes):
+    # Keys are content hashes, so guests of the same event share one blob and only its TTL is refreshed
+    client = get_redis()
+    if not client.set(REDIS_KEY_PREFIX + key, data, ex=settings.IMAGE_HANDOFF_TTL, nx=True):
+        client.expire(REDIS_KEY_PREFIX + key, settings.IMAGE_HANDOFF_TTL)
+
+
+def load_image(key: str) -> bytes | None:
+    return get_redis().get(REDIS_KEY_PREFIX + key)
@@ -1,58 +1,117 @@
+import hashlib
 import io
-import json
-import os
+from typing import NamedTuple
 
-from PIL import Image, ImageDraw, ImageFont
+from PIL import Image
 
-from src.config import settings
+from src.models.config_editor import OutputProfile
 from src.models.invitation import InvitationForm
-
-
-def _load_config(config_path: str) -> dict:
-    try:
-        with open(config_path, encoding="utf-8") as file:
-            return json.load(file)
-    except FileNotFoundError as e:
-        raise FileNotFoundError("Config file not found: " + str(e))  # noqa: B904
+from src.utils.assets import asset_path
+from src.utils.config_store import config_store
+from src.utils.metrics import stage_timer
+from src.utils.render_cache import render_cache, render_key
+from src.utils.template_store import template_store
+from src.utils.text_sprites import text_sprites
 
 
 def _draw_text_on_image(image: Image, text: str, position: tuple[int, int], font_path: str, font_size: int, color: str):
-    draw = ImageDraw.Draw(image)
-    font = ImageFont.truetype(font_path, font_size)
-    draw.text(position, text, font=font, fill=color)
+    sprite = text_sprites.get(font_path, font_size, text)
+    image.paste(color, (position[0] + sprite.offset[0], position[1] + sprite.offset[1]), sprite.mask)
 
 
-def _gen_invitation_img(template: str, texts_config: list, invitation_data: InvitationForm) -> bytes:
-    if not os.path.exists(template):
-        raise FileNotFoundError("Template image not found: " + template)
-
-    image = Image.open(template)
+def _draw_texts(image: Image.Image, texts_config: list, invitation_data: InvitationForm, scale: float = 1.0):
     type2text = {"date": invitation_data.date, "time": invitation_data.time, "address": invitation_data.address}
     for text_item in texts_config:
-        font_path = os.path.join(settings.FONT_FOLDER, text_item["font"])
-        if not os.path.exists(font_path):
-            raise FileNotFoundError("Font not found: " + str(font_path))
         _draw_text_on_image(
             image,
             type2text[text_item["type"]],
-            (int(text_item["x"]), int(text_item["y"])),
-            str(font_path),
-            text_item["size"],
+            (round(int(text_item["x"]) * scale), round(int(text_item["y"]) * scale)),
+            asset_path("fonts", text_item["font"]),
+            max(1, round(text_item["size"] * scale)),
             text_item["color"],
         )
 
+
+def _save_jpeg(image: Image.Image, **params) -> bytes:
     with io.BytesIO() as buf:
-        image.save(buf, format="JPEG")
-        img_bytes = buf.getvalue()
+        image.save(buf, format="JPEG", **params)
+        return buf.getvalue()
+
 
+def _encode_jpeg(image: Image.Image, output: OutputProfile | None) -> bytes:
+    if output is None:
+        return _save_jpeg(image)
+
+    max_size = (output.max_width or image.width, output.max_height or image.height)
+    if image.width > max_size[0] or image.height > max_size[1]:
+        image.thumbnail(max_size, Image.Resampling.LANCZOS)
+
+    params = {"optimize": output.optimize, "progressive": output.progressive}
+    if output.subsampling is not None:
+        params["subsampling"] = output.subsampling
+
+    quality = output.quality
+    while True:
+        img_bytes = _save_jpeg(image, quality=quality, **params)
+        if output.max_bytes is None or len(img_bytes) <= output.max_bytes or quality <= output.min_quality:
+            return img_bytes
+        quality = max(output.min_quality, quality - 10)
+
+
+def _gen_invitation_img(
+    template: str, texts_config: list, invitation_data: InvitationForm, output: OutputProfile | None = None
+) -> bytes:
+    try:
+        with stage_timer("template_decode"):
+            image = template_store.get(template)
+    except FileNotFoundError:
+        raise FileNotFoundError("Template image not found: " + template)  # noqa: B904
+
+    with stage_timer("text_draw"):
+        _draw_texts(image, texts_config, invitation_data)
+    with stage_timer("jpeg_encode"):
+        return _encode_jpeg(image, output)
+
+
+class RenderJob(NamedTuple):
+    key: str | None
+    template_path: str
+    texts_config: list
+    output: OutputProfile | None
+
+
+def plan_render(invitation_data: InvitationForm) -> RenderJob:
+    preset = config_store.get().presets.get(invitation_data.type)
+    if preset is None:
+        raise ValueError("Preset not found")
+    template_path = asset_path("templates", preset["template"])
+    font_paths = [asset_path("fonts", text_item["font"]) for text_item in preset["texts"]]
+    values = {"date": invitation_data.date, "time": invitation_data.time, "address": invitation_data.address}
+    output = OutputProfile.model_validate(preset["output"]) if preset.get("output") else None
+    try:
+        key = render_key(preset, template_path, font_paths, values)
+    except FileNotFoundError:
+        # Let the renderer report which asset is missing
+        key = None
+    return RenderJob(key, str(template_path), preset["texts"], output)
+
+
+def run_render(job: RenderJob, invitation_data: InvitationForm) -> bytes:
+    if job.key is None:
+        return _gen_invitation_img(job.template_path, job.texts_config, invitation_data, job.output)
+
+    img_bytes = render_cache.get(job.key)
+    if img_bytes is None:
+        img_bytes = _gen_invitation_img(job.template_path, job.texts_config, invitation_data, job.output)
+        render_cache.put(job.key, img_bytes)
     return img_bytes
 
 
+def render_invitation(invitation_data: InvitationForm) -> tuple[str, bytes]:
+    job = plan_render(invitation_data)
+    img_bytes = run_render(job, invitation_data)
+    return job.key or hashlib.sha256(img_bytes).hexdigest(), img_bytes
+
+
 def create_invitation(invitation_data: InvitationForm) -> bytes:
-    config = _load_config(settings.CONFIG_PATH)["presets"]
-    for preset in config:
-        if preset["name"] == invitation_data.type:
-            texts_config = preset["texts"]
-            template_path = os.path.join(settings.TEMPLATE_FOLDER, preset["template"])
-            return _gen_invitation_img(str(template_path), texts_config, invitation_data)
-    raise ValueError("Preset not found")
+    return render_invitation(invitation_data)[1]
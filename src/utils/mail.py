@@ -1,21 +1,35 @@
-import json
+import asyncio
+import base64
+import functools
 import smtplib
-from email import encoders
-from email.mime.base import MIMEBase
-from email.mime.image import MIMEImage
-from email.mime.multipart import MIMEMultipart
-from email.mime.text import MIMEText
+import string
+import uuid
+from email.header import Header
+
+import aiosmtplib
+from celery.exceptions import SoftTimeLimitExceeded
 
 from src.config import settings
 from src.models.invitation import InvitationForm
+from src.utils.async_smtp_pool import async_smtp_pool
+from src.utils.config_store import CityContacts, config_store
+from src.utils.metrics import SMTP_ERRORS, stage_timer
+from src.utils.smtp_pool import smtp_pool
 
+EMAIL_TEMPLATE_PATH = "storage/email/template.html"
+EMAIL_LOGO_PATH = "storage/email/assets/logo.png"
+EMAIL_SUBJECT = "Приглашение на мероприятие от QuestGuru"
 
-def _load_config(config_path: str) -> dict:
-    try:
-        with open(config_path, encoding="utf-8") as file:
-            return json.load(file)
-    except FileNotFoundError as e:
-        raise FileNotFoundError("Config file not found: " + str(e))  # noqa: B904
+CRLF = b"\r\n"
+_B64_LINE = 76
+
+
+class TransientDeliveryError(RuntimeError):
+    pass
+
+
+def _is_transient(code: int) -> bool:
+    return 400 <= code < 500  # noqa: PLR2004
 
 
 def _load_email_template(template_path: str) -> str:
@@ -26,54 +40,191 @@ def _load_email_template(template_path: str) -> str:
         raise FileNotFoundError("Email template not found: " + str(e))  # noqa: B904
 
 
-def send_email_with_attachment(invitation_data: InvitationForm, attachment: bytes):
-    msg = MIMEMultipart()
-    msg["From"] = settings.SMTP_USER
-    msg["To"] = invitation_data.email
-    msg["Subject"] = "Приглашение на мероприятие от QuestGuru"
-
-    config = _load_config(settings.CONFIG_PATH)
-    phone = config["city2phone"].get(invitation_data.city)
-    mail = config["city2email"].get(invitation_data.city)
-    vk = config["city2vk"].get(invitation_data.city)
-
-    html_template = _load_email_template("storage/email/template.html")
-    html_content = html_template.format(
-        date=invitation_data.date,
-        time=invitation_data.time,
-        address=invitation_data.address,
-        phone=phone,
-        vk=vk,
-        mail=mail,
-    )
-    msg.attach(MIMEText(html_content, "html", "utf-8"))
-
-    part = MIMEBase("application", "octet-stream")
-    part.set_payload(attachment)
-    encoders.encode_base64(part)
-    part.add_header("Content-Disposition", "attachment; filename=QuestGuru.jpg")
-    msg.attach(part)
-
+def _load_email_logo(logo_path: str) -> bytes:
     try:
-        with open("storage/email/assets/logo.png", "rb") as logo:
-            img = MIMEImage(logo.read())
-            img.add_header("Content-ID", "<logo>")
-            img.add_header("Content-Disposition", "inline", filename="logo.png")
-            msg.attach(img)
+        with open(logo_path, "rb") as file:
+            return file.read()
     except FileNotFoundError as e:
         raise FileNotFoundError("Email logo not found: " + str(e))  # noqa: B904
 
+
+def _b64_lines(data: bytes) -> bytes:
+    encoded = base64.b64encode(data)
+    return CRLF.join(encoded[i : i + _B64_LINE] for i in range(0, len(encoded), _B64_LINE)) + CRLF
+
+
+def _encode_header(value: str) -> str:
+    if "\r" in value or "\n" in value:
+        raise ValueError("Invalid email header value")
+    if value.isascii():
+        return value
+    return Header(value, "utf-8").encode(linesep="\r\n")
+
+
+def _mime_part(headers: list[tuple[str, str]], body: bytes) -> bytes:
+    head = "".join(f"{name}: {value}\r\n" for name, value in headers).encode("ascii")
+    return head + CRLF + body
+
+
+class _EmailTemplate:
+    def __init__(self, html_template: str, logo: bytes):
+        self.segments = [(literal, field, spec) for literal, field, spec, _ in string.Formatter().parse(html_template)]
+        self.headers = (
+            f"From: {_encode_header(settings.SMTP_USER)}\r\nSubject: {_encode_header(EMAIL_SUBJECT)}\r\n"
+            "MIME-Version: 1.0\r\n"
+        ).encode("ascii")
+        self.html_headers = _mime_part(
+            [
+                ("Content-Type", 'text/html; charset="utf-8"'),
+                ("MIME-Version", "1.0"),
+                ("Content-Transfer-Encoding", "base64"),
+            ],
+            b"",
+        )
+        self.attachment_headers = _mime_part(
+            [
+                ("Content-Type", "application/octet-stream"),
+                ("MIME-Version", "1.0"),
+                ("Content-Transfer-Encoding", "base64"),
+                ("Content-Disposition", "attachment; filename=QuestGuru.jpg"),
+            ],
+            b"",
+        )
+        self.logo_part = _mime_part(
+            [
+                ("Content-Type", "image/png"),
+                ("MIME-Version", "1.0"),
+                ("Content-Transfer-Encoding", "base64"),
+                ("Content-ID", "<logo>"),
+                ("Content-Disposition", 'inline; filename="logo.png"'),
+            ],
+            _b64_lines(logo),
+        )
+
+    def render_html(self, values: dict[str, object]) -> str:
+        out = []
+        for literal, field, spec in self.segments:
+            out.append(literal)
+            if field is not None:
+                out.append(format(values[field], spec or ""))
+        return "".join(out)
+
+    def build(self, recipient: str, values: dict[str, object], attachment: bytes) -> bytes:
+        boundary = ("=" * 15 + uuid.uuid4().hex + "==").encode("ascii")
+        delimiter = b"--" + boundary + CRLF
+        return b"".join(
+            (
+                f'Content-Type: multipart/mixed; boundary="{boundary.decode()}"\r\n'.encode("ascii"),
+                self.headers,
+                f"To: {_encode_header(recipient)}\r\n".encode("ascii"),
+                CRLF,
+                delimiter,
+                self.html_headers,
+                _b64_lines(self.render_html(values).encode("utf-8")),
+                delimiter,
+                self.attachment_headers,
+                _b64_lines(attachment),
+                delimiter,
+                self.logo_part,
+                CRLF,
+                b"--" + boundary + b"--" + CRLF,
+            )
+        )
+
+
+@functools.cache
+def _get_email_template() -> _EmailTemplate:
+    return _EmailTemplate(_load_email_template(EMAIL_TEMPLATE_PATH), _load_email_logo(EMAIL_LOGO_PATH))
+
+
+def build_email_message(invitation_data: InvitationForm, attachment: bytes) -> bytes:
+    contacts = config_store.get().cities.get(invitation_data.city) or CityContacts(None, None, None)
+    values = {
+        "date": invitation_data.date,
+        "time": invitation_data.time,
+        "address": invitation_data.address,
+        "phone": contacts.phone,
+        "vk": contacts.vk,
+        "mail": contacts.email,
+    }
+    return _get_email_template().build(invitation_data.email, values, attachment)
+
+
+def send_email_with_attachment(invitation_data: InvitationForm, attachment: bytes, deadline: float | None = None):
+    with stage_timer("mime_build"):
+        msg = build_email_message(invitation_data, attachment)
+
     try:
-        with smtplib.SMTP_SSL(settings.SMTP_SERVER, settings.SMTP_PORT) as server:
-            server.login(settings.SMTP_USER, settings.SMTP_PASSWORD)
-            server.sendmail(settings.SMTP_USER, invitation_data.email, msg.as_string())
+        smtp_pool.sendmail(settings.SMTP_USER, invitation_data.email, msg, deadline)
     except smtplib.SMTPRecipientsRefused as e:
+        SMTP_ERRORS.labels(error=type(e).__name__).inc()
+        if all(_is_transient(code) for code, _ in e.recipients.values()):
+            raise TransientDeliveryError(f"Email delivery deferred: recipient temporarily refused - {e}")  # noqa: B904
         raise ValueError(f"Email delivery failed: recipient refused - {e}")  # noqa: B904
     except smtplib.SMTPDataError as e:
+        SMTP_ERRORS.labels(error=type(e).__name__).inc()
+        if _is_transient(e.smtp_code):
+            raise TransientDeliveryError(f"Email delivery deferred: message temporarily rejected - {e}")  # noqa: B904
         raise ValueError(f"Email delivery failed: invalid mailbox or user not found - {e}")  # noqa: B904
-    except smtplib.SMTPAuthenticationError:
+    except smtplib.SMTPAuthenticationError as e:
+        SMTP_ERRORS.labels(error=type(e).__name__).inc()
         raise RuntimeError("SMTP authentication failed")  # noqa: B904
+    except (smtplib.SMTPServerDisconnected, smtplib.SMTPConnectError) as e:
+        SMTP_ERRORS.labels(error=type(e).__name__).inc()
+        raise TransientDeliveryError(f"SMTP connection failed: {e}")  # noqa: B904
+    except smtplib.SMTPResponseException as e:
+        SMTP_ERRORS.labels(error=type(e).__name__).inc()
+        if _is_transient(e.smtp_code):
+            raise TransientDeliveryError(f"SMTP server is temporarily unavailable: {e}")  # noqa: B904
+        raise RuntimeError(f"SMTP error occurred: {e}")  # noqa: B904
     except smtplib.SMTPException as e:
+        SMTP_ERRORS.labels(error=type(e).__name__).inc()
+        raise RuntimeError(f"SMTP error occurred: {e}")  # noqa: B904
+    except (TimeoutError, SoftTimeLimitExceeded) as e:
+        # The prefork pool raises SoftTimeLimitExceeded into a send that outlived the task's soft time limit
+        SMTP_ERRORS.labels(error=type(e).__name__).inc()
+        raise TransientDeliveryError(f"Email delivery timed out: {e}")  # noqa: B904
+    except OSError as e:
+        SMTP_ERRORS.labels(error=type(e).__name__).inc()
+        raise TransientDeliveryError(f"SMTP connection failed: {e}")  # noqa: B904
+    except Exception as e:
+        SMTP_ERRORS.labels(error=type(e).__name__).inc()
+        raise RuntimeError(f"Unexpected error sending email: {e}")  # noqa: B904
+
+
+async def send_email_with_attachment_async(invitation_data: InvitationForm, attachment: bytes):
+    with stage_timer("mime_build"):
+        msg = await asyncio.to_thread(build_email_message, invitation_data, attachment)
+
+    try:
+        await async_smtp_pool.sendmail(settings.SMTP_USER, invitation_data.email, msg)
+    except aiosmtplib.SMTPRecipientsRefused as e:
+        SMTP_ERRORS.labels(error=type(e).__name__).inc()
+        if all(_is_transient(refused.code) for refused in e.recipients):
+            raise TransientDeliveryError(f"Email delivery deferred: recipient temporarily refused - {e}")  # noqa: B904
+        raise ValueError(f"Email delivery failed: recipient refused - {e}")  # noqa: B904
+    except aiosmtplib.SMTPDataError as e:
+        SMTP_ERRORS.labels(error=type(e).__name__).inc()
+        if _is_transient(e.code):
+            raise TransientDeliveryError(f"Email delivery deferred: message temporarily rejected - {e}")  # noqa: B904
+        raise ValueError(f"Email delivery failed: invalid mailbox or user not found - {e}")  # noqa: B904
+    except aiosmtplib.SMTPAuthenticationError as e:
+        SMTP_ERRORS.labels(error=type(e).__name__).inc()
+        raise RuntimeError("SMTP authentication failed")  # noqa: B904
+    except (aiosmtplib.SMTPServerDisconnected, aiosmtplib.SMTPConnectError, aiosmtplib.SMTPTimeoutError) as e:
+        SMTP_ERRORS.labels(error=type(e).__name__).inc()
+        raise TransientDeliveryError(f"SMTP connection failed: {e}")  # noqa: B904
+    except aiosmtplib.SMTPResponseException as e:
+        SMTP_ERRORS.labels(error=type(e).__name__).inc()
+        if _is_transient(e.code):
+            raise TransientDeliveryError(f"SMTP server is temporarily unavailable: {e}")  # noqa: B904
+        raise RuntimeError(f"SMTP error occurred: {e}")  # noqa: B904
+    except aiosmtplib.SMTPException as e:
+        SMTP_ERRORS.labels(error=type(e).__name__).inc()
         raise RuntimeError(f"SMTP error occurred: {e}")  # noqa: B904
+    except OSError as e:
+        SMTP_ERRORS.labels(error=type(e).__name__).inc()
+        raise TransientDeliveryError(f"SMTP connection failed: {e}")  # noqa: B904
     except Exception as e:
+        SMTP_ERRORS.labels(error=type(e).__name__).inc()
         raise RuntimeError(f"Unexpected error sending email: {e}")  # noqa: B904
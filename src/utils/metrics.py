@@ -0,0 +1,94 @@
+import logging
+import os
+
+import redis
+from prometheus_client import REGISTRY, CollectorRegistry, Counter, Histogram, multiprocess, start_http_server
+from prometheus_client.core import GaugeMetricFamily
+from prometheus_client.registry import Collector
+
+from src.utils.redis_client import get_redis
+
+logger = logging.getLogger(__name__)
+
+QUEUES = ("render", "deliver", "celery")
+
+_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+STAGE_SECONDS = Histogram(
+    "invitation_stage_seconds",
+    "Time spent in each stage of rendering and delivering an invitation",
+    ["stage"],
+    buckets=_BUCKETS,
+)
+INVITATIONS = Counter(
+    "invitations",
+    "Invitations processed by workers, by preset and outcome",
+    ["preset", "result"],
+)
+SMTP_ERRORS = Counter(
+    "smtp_errors",
+    "Failed email deliveries by exception class",
+    ["error"],
+)
+ENQUEUE_SECONDS = Histogram(
+    "invitation_enqueue_seconds",
+    "Time spent publishing invitation tasks to the broker",
+    ["endpoint"],
+    buckets=_BUCKETS,
+)
+ENQUEUE_REJECTED = Counter(
+    "invitation_enqueue_rejected",
+    "Invitation requests turned away by backpressure, by reason",
+    ["reason"],
+)
+
+
+def stage_timer(stage: str):
+    return STAGE_SECONDS.labels(stage=stage).time()
+
+
+class QueueDepthCollector(Collector):
+    def describe(self):
+        # Without this the registry calls collect() on registration, which would hit Redis at import time
+        return []
+
+    def collect(self):
+        try:
+            with get_redis().pipeline(transaction=False) as pipe:
+                for queue in QUEUES:
+                    pipe.llen(queue)
+                depths = pipe.execute()
+        except redis.RedisError as e:
+            logger.warning("Failed to read queue depth: %s", e)
+            return
+        gauge = GaugeMetricFamily("invitation_queue_depth", "Messages waiting in each Celery queue", labels=["queue"])
+        for queue, depth in zip(QUEUES, depths, strict=True):
+            gauge.add_metric([queue], depth)
+        yield gauge
+
+
+REGISTRY.register(QueueDepthCollector())
+
+
+def metrics_registry() -> CollectorRegistry:
+    # Prefork children each write their samples to PROMETHEUS_MULTIPROC_DIR; aggregate them at scrape time
+    if not os.environ.get("PROMETHEUS_MULTIPROC_DIR"):
+        return REGISTRY
+    registry = CollectorRegistry()
+    multiprocess.MultiProcessCollector(registry)
+    registry.register(QueueDepthCollector())
+    return registry
+
+
+def start_worker_exporter(port: int):
+    folder = os.environ.get("PROMETHEUS_MULTIPROC_DIR")
+    if folder:
+        # Other workers may already be writing here, so samples from a previous run are cleared by whatever starts
+        # the container rather than by each worker
+        os.makedirs(folder, exist_ok=True)
+    start_http_server(port, registry=metrics_registry())
+
+
+def mark_worker_process_dead(pid: int):
+    if os.environ.get("PROMETHEUS_MULTIPROC_DIR"):
+        multiprocess.mark_process_dead(pid)
@@ -0,0 +1,75 @@
+import os
+from collections import OrderedDict
+
+from PIL import Image
+
+from src.config import settings
+from src.models.config_editor import OutputProfile
+from src.models.invitation import InvitationForm
+from src.utils.img_gen import _draw_texts, _encode_jpeg, _gen_invitation_img
+from src.utils.process_pool import ProcessPool
+
+_SCALED_TEMPLATES_MAX = 8
+
+_scaled_templates: OrderedDict[tuple, tuple[Image.Image, float]] = OrderedDict()
+
+_pool = ProcessPool(settings.PREVIEW_POOL_SIZE)
+
+
+def _load_scaled_template(path: str, scale: float | None, max_width: int | None) -> tuple[Image.Image, float]:
+    try:
+        st = os.stat(path)
+    except FileNotFoundError:
+        raise FileNotFoundError("Template image not found: " + path)  # noqa: B904
+    key = (path, st.st_mtime_ns, st.st_size, scale, max_width)
+    cached = _scaled_templates.get(key)
+    if cached is not None:
+        _scaled_templates.move_to_end(key)
+        return cached[0].copy(), cached[1]
+
+    with Image.open(path) as src:
+        width, height = src.size
+        factor = min(scale or 1.0, max_width / width if max_width else 1.0, 1.0)
+        target = (max(1, round(width * factor)), max(1, round(height * factor)))
+        # For JPEG this makes the decoder skip straight to the nearest 1/2, 1/4 or 1/8 scale
+        src.draft(src.mode, target)
+        image = src.resize(target, Image.Resampling.LANCZOS) if src.size != target else src.copy()
+
+    _scaled_templates[key] = (image, factor)
+    while len(_scaled_templates) > _SCALED_TEMPLATES_MAX:
+        _scaled_templates.popitem(last=False)
+    return image.copy(), factor
+
+
+def render_preview(
+    template_path: str,
+    texts_config: list,
+    invitation_data: InvitationForm,
+    output: OutputProfile | None,
+    *,
+    scale: float | None,
+    max_width: int | None,
+) -> bytes:
+    if scale is None and max_width is None:
+        return _gen_invitation_img(template_path, texts_config, invitation_data, output)
+
+    image, factor = _load_scaled_template(template_path, scale, max_width)
+    _draw_texts(image, texts_config, invitation_data, factor)
+    if output is not None:
+        # Size limits are meaningless for a downscaled preview; only the encoder settings carry over
+        output = output.model_copy(update={"max_width": None, "max_height": None, "max_bytes": None})
+    return _encode_jpeg(image, output)
+
+
+async def run_preview(
+    template_path: str,
+    texts_config: list,
+    invitation_data: InvitationForm,
+    output: OutputProfile | None,
+    *,
+    scale: float | None,
+    max_width: int | None,
+) -> bytes:
+    return await _pool.run(
+        render_preview, template_path, texts_config, invitation_data, output, scale=scale, max_width=max_width
+    )
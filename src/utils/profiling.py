@@ -0,0 +1,130 @@
+import contextlib
+import cProfile
+import json
+import logging
+import os
+import random
+import threading
+import time
+import uuid
+from contextvars import ContextVar
+from typing import Any
+
+from fastapi.concurrency import run_in_threadpool
+from starlette.datastructures import Headers
+from starlette.types import ASGIApp, Receive, Scope, Send
+
+from src.config import settings
+
+logger = logging.getLogger(__name__)
+
+PROFILE_HEADER = "x-profile"
+
+_tags: ContextVar[dict[str, str] | None] = ContextVar("profile_tags", default=None)
+
+# cProfile hooks the thread it is enabled on, and all requests share the event loop thread
+_request_lock = threading.Lock()
+
+_task_profiles: dict[str, tuple[cProfile.Profile, float]] = {}
+
+
+def should_sample() -> bool:
+    return settings.PROFILING_ENABLED and random.random() < settings.PROFILING_SAMPLE_RATE
+
+
+def tag_profile(**tags: str):
+    current = _tags.get()
+    if current is not None:
+        current.update(tags)
+
+
+def save_profile(profiler: cProfile.Profile, kind: str, duration: float, tags: dict[str, str], forced: bool = False):
+    if not forced and duration < settings.PROFILING_THRESHOLD:
+        return
+    profile_id = f"{int(time.time() * 1000)}-{uuid.uuid4().hex[:8]}"
+    meta = {"id": profile_id, "kind": kind, "duration": round(duration, 4), "created_at": time.time(), **tags}
+    try:
+        os.makedirs(settings.PROFILING_DIR, exist_ok=True)
+        path = os.path.join(settings.PROFILING_DIR, profile_id)
+        profiler.dump_stats(path + ".prof")
+        with open(path + ".json", "w", encoding="utf-8") as file:
+            json.dump(meta, file, ensure_ascii=False)
+    except OSError as e:
+        logger.warning("Failed to save profile: %s", e)
+        return
+    logger.info("Saved %s profile %s (%.3fs)", kind, profile_id, duration)
+    _rotate()
+
+
+def _rotate():
+    names = sorted(name for name in os.listdir(settings.PROFILING_DIR) if name.endswith(".json"))
+    for name in names[: max(0, len(names) - settings.PROFILING_MAX_FILES)]:
+        stem = os.path.join(settings.PROFILING_DIR, name.removesuffix(".json"))
+        for suffix in (".json", ".prof"):
+            with contextlib.suppress(FileNotFoundError):
+                os.remove(stem + suffix)
+
+
+def list_profiles() -> list[dict[str, Any]]:
+    try:
+        names = sorted((name for name in os.listdir(settings.PROFILING_DIR) if name.endswith(".json")), reverse=True)
+    except FileNotFoundError:
+        return []
+    profiles = []
+    for name in names:
+        with (
+            contextlib.suppress(FileNotFoundError, json.JSONDecodeError),
+            open(os.path.join(settings.PROFILING_DIR, name), encoding="utf-8") as file,
+        ):
+            profiles.append(json.load(file))
+    return profiles
+
+
+def profile_path(profile_id: str) -> str:
+    return os.path.join(settings.PROFILING_DIR, profile_id + ".prof")
+
+
+def begin_task_profile(task_id: str):
+    if should_sample():
+        profiler = cProfile.Profile()
+        _task_profiles[task_id] = (profiler, time.perf_counter())
+        profiler.enable()
+
+
+def end_task_profile(task_id: str, tags: dict[str, str]):
+    entry = _task_profiles.pop(task_id, None)
+    if entry is not None:
+        profiler, started = entry
+        profiler.disable()
+        save_profile(profiler, "task", time.perf_counter() - started, tags)
+
+
+class ProfilingMiddleware:
+    def __init__(self, app: ASGIApp):
+        self.app = app
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        headers = Headers(scope=scope)
+        # Forcing a profile costs the server time, so it takes the API key
+        forced = headers.get(PROFILE_HEADER) == "1" and headers.get("api-key") == settings.API_KEY
+        if not (forced or should_sample()) or not _request_lock.acquire(blocking=False):
+            await self.app(scope, receive, send)
+            return
+
+        # Whatever else runs on the loop meanwhile ends up in the profile too; work sent to threads does not
+        tags = {"stage": f"{scope['method']} {scope['path']}"}
+        token = _tags.set(tags)
+        profiler = cProfile.Profile()
+        started = time.perf_counter()
+        profiler.enable()
+        try:
+            await self.app(scope, receive, send)
+        finally:
+            profiler.disable()
+            duration = time.perf_counter() - started
+            _tags.reset(token)
+            _request_lock.release()
+            await run_in_threadpool(save_profile, profiler, "request", duration, tags, forced)
@@ -0,0 +1,67 @@
+import logging
+
+import redis
+
+from src.config import settings
+from src.utils.redis_client import get_redis
+
+logger = logging.getLogger(__name__)
+
+REDIS_KEY_PREFIX = "img-invitation:smtp-bucket:"
+
+# Tokens may go negative: every caller gets the next free send slot and sleeps until it, which spreads a burst
+# evenly at the configured rate instead of letting it through and tripping the provider's limit. Callers that
+# would have to wait longer than max_wait get nothing reserved and should come back later. Redis' clock is used
+# so that all worker nodes agree on the refill.
+_RESERVE_SCRIPT = """
+local rate = tonumber(ARGV[1])
+local burst = tonumber(ARGV[2])
+local max_wait = tonumber(ARGV[3])
+local time = redis.call('TIME')
+local now = tonumber(time[1]) + tonumber(time[2]) / 1000000
+
+local state = redis.call('HMGET', KEYS[1], 'tokens', 'ts')
+local tokens = tonumber(state[1]) or burst
+local ts = tonumber(state[2]) or now
+tokens = math.min(burst, tokens + math.max(0, now - ts) * rate)
+
+local wait = 0
+if tokens < 1 then
+    wait = (1 - tokens) / rate
+end
+if wait > max_wait then
+    return {0, tostring(wait)}
+end
+
+redis.call('HSET', KEYS[1], 'tokens', tostring(tokens - 1), 'ts', tostring(now))
+redis.call('EXPIRE', KEYS[1], math.ceil(burst / rate + max_wait) + 60)
+return {1, tostring(wait)}
+"""
+
+
+class TokenBucket:
+    def __init__(self, name: str, rate: float, burst: int, max_wait: float):
+        self.key = REDIS_KEY_PREFIX + name
+        self.rate = rate
+        self.burst = burst
+        self.max_wait = max_wait
+        self._script: redis.commands.core.Script | None = None
+
+    def reserve(self) -> tuple[bool, float]:
+        if self.rate <= 0:
+            return True, 0.0
+        client = get_redis()
+        if self._script is None:
+            self._script = client.register_script(_RESERVE_SCRIPT)
+        try:
+            granted, wait = self._script(keys=[self.key], args=[self.rate, self.burst, self.max_wait], client=client)
+        except redis.RedisError as e:
+            # Sending unthrottled beats not sending at all while Redis is down
+            logger.warning("SMTP rate limiter unavailable, sending without it: %s", e)
+            return True, 0.0
+        return bool(granted), float(wait)
+
+
+smtp_rate_limiter = TokenBucket(
+    settings.SMTP_USER, settings.SMTP_RATE_LIMIT, settings.SMTP_RATE_BURST, settings.SMTP_RATE_MAX_WAIT
+)
@@ -0,0 +1,31 @@
+import asyncio
+import os
+
+import redis
+import redis.asyncio
+
+from src.config import settings
+
+_client: redis.Redis | None = None
+_client_pid: int | None = None
+_async_client: redis.asyncio.Redis | None = None
+_async_client_loop: asyncio.AbstractEventLoop | None = None
+
+
+def get_redis() -> redis.Redis:
+    global _client, _client_pid  # noqa: PLW0603
+    # Connection pools must not be shared across a fork, so every worker child gets its own client
+    if _client is None or _client_pid != os.getpid():
+        _client = redis.Redis.from_url(settings.REDIS_URL)
+        _client_pid = os.getpid()
+    return _client
+
+
+def get_async_redis() -> redis.asyncio.Redis:
+    global _async_client, _async_client_loop  # noqa: PLW0603
+    # Async connections are bound to the loop that opened them
+    loop = asyncio.get_running_loop()
+    if _async_client is None or _async_client_loop is not loop:
+        _async_client = redis.asyncio.Redis.from_url(settings.REDIS_URL)
+        _async_client_loop = loop
+    return _async_client
@@ -0,0 +1,157 @@
+import contextlib
+import hashlib
+import json
+import logging
+import os
+import tempfile
+import threading
+import time
+from typing import Any
+
+import redis
+
+from src.config import settings
+from src.utils.redis_client import get_redis
+
+logger = logging.getLogger(__name__)
+
+REDIS_KEY_PREFIX = "img-invitation:render:"
+_JPEG_END = b"\xff\xd9"
+
+_digests: dict[str, tuple[tuple[int, int], str]] = {}
+_digests_lock = threading.Lock()
+
+
+def file_digest(path: str) -> str:
+    st = os.stat(path)
+    stamp = (st.st_mtime_ns, st.st_size)
+    with _digests_lock:
+        cached = _digests.get(path)
+    if cached is not None and cached[0] == stamp:
+        return cached[1]
+
+    with open(path, "rb") as file:
+        digest = hashlib.file_digest(file, "sha256").hexdigest()
+    with _digests_lock:
+        _digests[path] = (stamp, digest)
+    return digest
+
+
+def render_key(preset: dict[str, Any], template_path: str, font_paths: list[str], values: dict[str, str]) -> str:
+    payload = {
+        "preset": preset,
+        "template": file_digest(template_path),
+        "fonts": sorted(file_digest(path) for path in set(font_paths)),
+        "values": values,
+    }
+    encoded = json.dumps(payload, sort_keys=True, ensure_ascii=False).encode("utf-8")
+    return hashlib.sha256(encoded).hexdigest()
+
+
+def _discard(path: str):
+    with contextlib.suppress(OSError):
+        os.remove(path)
+
+
+class RenderCache:
+    def __init__(self, folder: str, ttl: int, max_bytes: int, use_redis: bool):
+        self.folder = folder
+        self.ttl = ttl
+        self.max_bytes = max_bytes
+        self.use_redis = use_redis
+        self._swept_at = 0.0
+
+    def _path(self, key: str) -> str:
+        return os.path.join(self.folder, key[:2], key + ".jpg")
+
+    def get(self, key: str) -> bytes | None:
+        if self.folder:
+            path = self._path(key)
+            try:
+                st = os.stat(path)
+                if time.time() - st.st_mtime < self.ttl:
+                    with open(path, "rb") as file:
+                        data = file.read()
+                    if data.endswith(_JPEG_END):
+                        # Access time is often disabled on mounts, so bump mtime to keep hot entries from expiring
+                        with contextlib.suppress(OSError):
+                            os.utime(path)
+                        return data
+                    logger.warning("Dropping truncated render cache entry %s", path)
+                    _discard(path)
+            except FileNotFoundError:
+                pass
+            except OSError as e:
+                # An unreadable entry is a miss; the render that follows writes a fresh one
+                logger.warning("Render cache read from disk failed, dropping %s: %s", path, e)
+                _discard(path)
+
+        if self.use_redis:
+            try:
+                data = get_redis().get(REDIS_KEY_PREFIX + key)
+            except redis.RedisError as e:
+                logger.warning("Render cache lookup in Redis failed: %s", e)
+                return None
+            if data is not None:
+                self._put_local(key, data)
+                return data
+        return None
+
+    def put(self, key: str, data: bytes):
+        self._put_local(key, data)
+        if self.use_redis:
+            try:
+                get_redis().set(REDIS_KEY_PREFIX + key, data, ex=self.ttl)
+            except redis.RedisError as e:
+                logger.warning("Render cache store in Redis failed: %s", e)
+
+    def _put_local(self, key: str, data: bytes):
+        if not self.folder or len(data) > self.max_bytes:
+            return
+        path = self._path(key)
+        try:
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(path), suffix=".tmp")
+            with os.fdopen(fd, "wb") as file:
+                file.write(data)
+            os.replace(tmp_path, path)
+        except OSError as e:
+            logger.warning("Render cache store on disk failed: %s", e)
+            return
+
+        if time.monotonic() - self._swept_at >= settings.RENDER_CACHE_SWEEP_INTERVAL:
+            self._swept_at = time.monotonic()
+            self.sweep()
+
+    def sweep(self):
+        entries = []
+        now = time.time()
+        for root, _, files in os.walk(self.folder):
+            for name in files:
+                path = os.path.join(root, name)
+                try:
+                    st = os.stat(path)
+                except FileNotFoundError:
+                    continue
+                # Leftover temp files from crashed writers are only removed once they are clearly stale
+                if now - st.st_mtime >= self.ttl or (name.endswith(".tmp") and now - st.st_mtime >= 60):  # noqa: PLR2004
+                    with contextlib.suppress(FileNotFoundError):
+                        os.remove(path)
+                    continue
+                entries.append((st.st_mtime, st.st_size, path))
+
+        total = sum(size for _, size, _ in entries)
+        for _, size, path in sorted(entries):
+            if total <= self.max_bytes:
+                break
+            with contextlib.suppress(FileNotFoundError):
+                os.remove(path)
+            total -= size
+
+
+render_cache = RenderCache(
+    settings.RENDER_CACHE_DIR,
+    settings.RENDER_CACHE_TTL,
+    settings.RENDER_CACHE_MAX_BYTES,
+    settings.RENDER_CACHE_REDIS,
+)
@@ -0,0 +1,40 @@
+import asyncio
+
+from fastapi import HTTPException, status
+
+from src.config import settings
+from src.models.invitation import InvitationForm
+from src.utils.img_gen import RenderJob, run_render
+from src.utils.process_pool import ProcessPool
+
+
+class RenderPool:
+    def __init__(self, size: int, max_pending: int):
+        self.max_pending = max_pending
+        self._pool = ProcessPool(size)
+        self._inflight: dict[str, asyncio.Future[bytes]] = {}
+
+    async def render(self, key: str, job: RenderJob, invitation_data: InvitationForm) -> bytes:
+        future = self._inflight.get(key)
+        if future is None:
+            if len(self._inflight) >= self.max_pending:
+                raise HTTPException(
+                    status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+                    detail="Too many renders in progress, try again later",
+                    headers={"Retry-After": "1"},
+                )
+            # Identical requests that arrive while this one renders wait for its result instead of rendering again
+            future = asyncio.ensure_future(self._pool.run(run_render, job, invitation_data))
+            self._inflight[key] = future
+            future.add_done_callback(lambda f: self._done(key, f))
+        # Shielded so that a client going away doesn't cancel the render other requests are waiting on
+        return await asyncio.shield(future)
+
+    def _done(self, key: str, future: asyncio.Future[bytes]):
+        self._inflight.pop(key, None)
+        if not future.cancelled():
+            # Mark the error as retrieved even if every waiter has disconnected
+            future.exception()
+
+
+render_pool = RenderPool(settings.RENDER_POOL_SIZE, settings.RENDER_MAX_PENDING)
@@ -0,0 +1,155 @@
+import contextlib
+import os
+import smtplib
+import socket
+import threading
+import time
+from collections import deque
+
+from src.config import settings
+from src.utils.metrics import stage_timer
+
+_MESSAGE_ERRORS = (smtplib.SMTPRecipientsRefused, smtplib.SMTPSenderRefused, smtplib.SMTPDataError)
+
+
+class _Session:
+    def __init__(self, conn: smtplib.SMTP):
+        self.conn = conn
+        self.created_at = time.monotonic()
+        self.last_used = self.created_at
+        self.uses = 0
+        self.aborted = False
+
+    def expired(self) -> bool:
+        return (
+            self.aborted
+            or self.uses >= settings.SMTP_SESSION_MAX_MESSAGES
+            or time.monotonic() - self.created_at >= settings.SMTP_SESSION_MAX_AGE
+        )
+
+    def alive(self) -> bool:
+        if time.monotonic() - self.last_used < settings.SMTP_NOOP_INTERVAL:
+            return True
+        try:
+            return self.conn.noop()[0] == 250  # noqa: PLR2004
+        except (smtplib.SMTPException, OSError):
+            return False
+
+    def close(self):
+        try:
+            self.conn.quit()
+        except (smtplib.SMTPException, OSError):
+            self.conn.close()
+
+
+def _abort(session: _Session):
+    session.aborted = True
+    # shutdown() wakes a thread blocked reading the socket, close() would not
+    with contextlib.suppress(OSError, AttributeError):
+        session.conn.sock.shutdown(socket.SHUT_RDWR)
+
+
+def _check_deadline(deadline: float | None):
+    if deadline is not None and time.monotonic() >= deadline:
+        raise TimeoutError("Delivery time limit exceeded")
+
+
+@contextlib.contextmanager
+def _deadline_guard(session: _Session, deadline: float | None):
+    if deadline is None:
+        yield
+        return
+    # Celery's thread pool ignores task time limits, so a send stalled past the deadline is cut off here
+    watchdog = threading.Timer(deadline - time.monotonic(), _abort, (session,))
+    watchdog.daemon = True
+    watchdog.start()
+    try:
+        yield
+    except (smtplib.SMTPException, OSError) as e:
+        if session.aborted:
+            raise TimeoutError("Delivery time limit exceeded") from e
+        raise
+    finally:
+        watchdog.cancel()
+
+
+class SMTPPool:
+    def __init__(self, size: int):
+        self.size = size
+        self._idle: deque[_Session] = deque()
+        self._lock = threading.Lock()
+        self._pid = os.getpid()
+
+    def _connect(self) -> _Session:
+        with stage_timer("smtp_connect"):
+            smtp_class = smtplib.SMTP_SSL if settings.SMTP_SSL else smtplib.SMTP
+            conn = smtp_class(settings.SMTP_SERVER, settings.SMTP_PORT, timeout=settings.SMTP_TIMEOUT)
+        try:
+            with stage_timer("smtp_login"):
+                conn.login(settings.SMTP_USER, settings.SMTP_PASSWORD)
+        except BaseException:
+            conn.close()
+            raise
+        return _Session(conn)
+
+    def _acquire(self) -> _Session:
+        with self._lock:
+            if self._pid != os.getpid():
+                # Sessions inherited from the parent process share its sockets; drop them without QUIT
+                self._idle.clear()
+                self._pid = os.getpid()
+            while self._idle:
+                session = self._idle.pop()
+                if not session.expired() and session.alive():
+                    return session
+                session.close()
+        return self._connect()
+
+    def _release(self, session: _Session):
+        session.last_used = time.monotonic()
+        with self._lock:
+            if len(self._idle) < self.size and not session.expired():
+                self._idle.append(session)
+                return
+        session.close()
+
+    def _send(self, session: _Session, from_addr: str, to_addr: str, msg: bytes, deadline: float | None):
+        session.uses += 1
+        try:
+            with stage_timer("smtp_send"), _deadline_guard(session, deadline):
+                session.conn.sendmail(from_addr, to_addr, msg)
+        except smtplib.SMTPServerDisconnected:
+            session.conn.close()
+            raise
+        except _MESSAGE_ERRORS:
+            # The server rejected this message but the session itself is still usable
+            self._release(session)
+            raise
+        except BaseException:
+            session.close()
+            raise
+        self._release(session)
+
+    def sendmail(self, from_addr: str, to_addr: str, msg: bytes, deadline: float | None = None):
+        _check_deadline(deadline)
+        session = self._acquire()
+        reused = session.uses > 0
+        try:
+            self._send(session, from_addr, to_addr, msg, deadline)
+        except smtplib.SMTPServerDisconnected:
+            if not reused:
+                raise
+            # The server dropped an idle session between the liveness check and the send; retry on a fresh one
+            _check_deadline(deadline)
+            self._send(self._connect(), from_addr, to_addr, msg, deadline)
+
+    def close_all(self):
+        with self._lock:
+            sessions = list(self._idle) if self._pid == os.getpid() else []
+            self._idle.clear()
+        for session in sessions:
+            with contextlib.suppress(Exception):
+                session.close()
+
+
+smtp_pool = SMTPPool(settings.SMTP_POOL_SIZE)
@@ -0,0 +1,44 @@
+import hashlib
+import os
+import threading
+from typing import NamedTuple
+
+from src.utils.compression import ENCODINGS, compress
+
+
+class AssetVariant(NamedTuple):
+    body: bytes
+    encoding: str | None
+    etag: str
+
+
+class StaticAsset:
+    def __init__(self, path: str):
+        self.path = path
+        self._stamp: tuple[int, int] | None = None
+        self._variants: dict[str | None, AssetVariant] = {}
+        self._lock = threading.Lock()
+
+    def load(self):
+        st = os.stat(self.path)
+        stamp = (st.st_mtime_ns, st.st_size)
+        if stamp == self._stamp:
+            return
+        with self._lock:
+            if stamp == self._stamp:
+                return
+            with open(self.path, "rb") as file:
+                body = file.read()
+            digest = hashlib.sha256(body).hexdigest()[:32]
+            # Every representation needs its own strong ETag, so the coding is part of it
+            variants = {None: AssetVariant(body, None, f'"{digest}"')}
+            for encoding in ENCODINGS:
+                compressed = compress(body, encoding, best=True)
+                if len(compressed) < len(body):
+                    variants[encoding] = AssetVariant(compressed, encoding, f'"{digest}-{encoding}"')
+            self._variants, self._stamp = variants, stamp
+
+    def variant(self, encoding: str | None) -> AssetVariant:
+        self.load()
+        variants = self._variants
+        return variants.get(encoding) or variants[None]
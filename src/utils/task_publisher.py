@@ -0,0 +1,95 @@
+import asyncio
+import logging
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import redis
+from celery.canvas import Signature
+from fastapi import HTTPException, status
+
+from src.celery_app import celery_app
+from src.config import settings
+from src.utils.metrics import ENQUEUE_REJECTED, ENQUEUE_SECONDS, QUEUES
+from src.utils.redis_client import get_async_redis
+
+logger = logging.getLogger(__name__)
+
+_LATENCY_WEIGHT = 0.2
+
+
+class TaskPublisher:
+    def __init__(self, pool_size: int):
+        self.pool_size = pool_size
+        self._executor: ThreadPoolExecutor | None = None
+        self._latency = 0.0
+        self._latency_at = 0.0
+        self._depth = 0
+        self._depth_at = float("-inf")
+
+    def _get_executor(self) -> ThreadPoolExecutor:
+        if self._executor is None:
+            self._executor = ThreadPoolExecutor(self.pool_size, thread_name_prefix="task-publisher")
+        return self._executor
+
+    async def check_backpressure(self):
+        if (
+            settings.ENQUEUE_MAX_PUBLISH_LATENCY
+            and self._latency >= settings.ENQUEUE_MAX_PUBLISH_LATENCY
+            # Nothing is published while we reject, so a slow sample only counts for one retry window
+            and time.monotonic() - self._latency_at < settings.ENQUEUE_RETRY_AFTER
+        ):
+            ENQUEUE_REJECTED.labels(reason="publish_latency").inc()
+            raise HTTPException(
+                status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+                detail="Task broker is responding slowly, try again later",
+                headers={"Retry-After": str(settings.ENQUEUE_RETRY_AFTER)},
+            )
+
+        if settings.ENQUEUE_MAX_QUEUE_DEPTH and await self._queue_depth() >= settings.ENQUEUE_MAX_QUEUE_DEPTH:
+            ENQUEUE_REJECTED.labels(reason="queue_depth").inc()
+            raise HTTPException(
+                status_code=status.HTTP_429_TOO_MANY_REQUESTS,
+                detail="Too many invitations are waiting to be processed, try again later",
+                headers={"Retry-After": str(settings.ENQUEUE_RETRY_AFTER)},
+            )
+
+    async def _queue_depth(self) -> int:
+        if time.monotonic() - self._depth_at < settings.ENQUEUE_DEPTH_CHECK_INTERVAL:
+            return self._depth
+        # Stamp before awaiting so concurrent requests reuse the previous value instead of piling on LLENs
+        self._depth_at = time.monotonic()
+        try:
+            async with get_async_redis().pipeline(transaction=False) as pipe:
+                for queue in QUEUES:
+                    pipe.llen(queue)
+                self._depth = sum(await pipe.execute())
+        except redis.RedisError as e:
+            # Publishing will report a broker outage on its own; don't reject on a failed probe
+            logger.warning("Failed to read queue depth: %s", e)
+            self._depth = 0
+        return self._depth
+
+    async def publish(self, signatures: list[Signature], endpoint: str):
+        started = time.perf_counter()
+        try:
+            await asyncio.get_running_loop().run_in_executor(self._get_executor(), self._publish, signatures)
+        finally:
+            elapsed = time.perf_counter() - started
+            ENQUEUE_SECONDS.labels(endpoint=endpoint).observe(elapsed)
+            self._record_latency(elapsed / max(1, len(signatures)))
+
+    def _record_latency(self, latency: float):
+        if time.monotonic() - self._latency_at >= settings.ENQUEUE_RETRY_AFTER:
+            self._latency = latency
+        else:
+            self._latency += _LATENCY_WEIGHT * (latency - self._latency)
+        self._latency_at = time.monotonic()
+
+    @staticmethod
+    def _publish(signatures: list[Signature]):
+        with celery_app.producer_or_acquire() as producer:
+            for signature in signatures:
+                signature.apply_async(producer=producer)
+
+
+task_publisher = TaskPublisher(settings.ENQUEUE_POOL_SIZE)
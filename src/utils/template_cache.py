@@ -0,0 +1,65 @@
+import os
+import threading
+from collections import OrderedDict
+from typing import NamedTuple
+
+from PIL import Image
+
+from src.config import settings
+
+
+class _CacheEntry(NamedTuple):
+    stamp: tuple[int, int]
+    image: Image.Image
+    nbytes: int
+
+
+def _image_nbytes(image: Image.Image) -> int:
+    width, height = image.size
+    return width * height * len(image.getbands())
+
+
+class TemplateCache:
+    def __init__(self, max_bytes: int):
+        self.max_bytes = max_bytes
+        self._entries: OrderedDict[str, _CacheEntry] = OrderedDict()
+        self._size = 0
+        self._lock = threading.Lock()
+
+    def get(self, path: str) -> Image.Image:
+        st = os.stat(path)
+        stamp = (st.st_mtime_ns, st.st_size)
+
+        with self._lock:
+            entry = self._entries.get(path)
+            if entry is not None and entry.stamp == stamp:
+                self._entries.move_to_end(path)
+                return entry.image.copy()
+
+        with Image.open(path) as src:
+            src.load()
+            image = src.copy()
+
+        self._put(path, _CacheEntry(stamp, image, _image_nbytes(image)))
+        return image.copy()
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._size = 0
+
+    def _put(self, path: str, entry: _CacheEntry):
+        with self._lock:
+            old = self._entries.pop(path, None)
+            if old is not None:
+                self._size -= old.nbytes
+            if entry.nbytes > self.max_bytes:
+                return
+            self._entries[path] = entry
+            self._size += entry.nbytes
+            while self._size > self.max_bytes:
+                _, evicted = self._entries.popitem(last=False)
+                self._size -= evicted.nbytes
+
+
+template_cache = TemplateCache(settings.TEMPLATE_CACHE_MAX_BYTES)
@@ -0,0 +1,164 @@
+import contextlib
+import fcntl
+import hashlib
+import io
+import json
+import logging
+import os
+import tempfile
+import threading
+import time
+from collections.abc import Iterator
+from typing import Any
+
+from PIL import Image
+
+from src.config import settings
+
+logger = logging.getLogger(__name__)
+
+INDEX_FILE = ".index.json"
+STAGING_DIR = ".incoming"
+THUMBNAILS_DIR = ".thumbnails"
+
+
+def file_sha256(path: str) -> str:
+    with open(path, "rb") as file:
+        return hashlib.file_digest(file, "sha256").hexdigest()
+
+
+def write_atomic(path: str, data: bytes):
+    fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(path), prefix=".", suffix=".tmp")
+    try:
+        with os.fdopen(fd, "wb") as file:
+            file.write(data)
+        os.chmod(tmp_path, 0o644)
+        os.replace(tmp_path, path)
+    except BaseException:
+        with contextlib.suppress(FileNotFoundError):
+            os.remove(tmp_path)
+        raise
+
+
+def describe_template(path: str) -> dict[str, Any]:
+    with Image.open(path) as image:
+        width, height, mode, image_format = image.width, image.height, image.mode, image.format
+    return {
+        "width": width,
+        "height": height,
+        "mode": mode,
+        "format": image_format,
+        "bytes": os.path.getsize(path),
+        "sha256": file_sha256(path),
+    }
+
+
+class TemplateIndex:
+    def __init__(self, folder: str):
+        self.folder = folder
+        self._entries: dict[str, dict[str, Any]] | None = None
+        self._stamp: tuple[int, int] | None = None
+        self._lock = threading.Lock()
+
+    @property
+    def index_path(self) -> str:
+        return os.path.join(self.folder, INDEX_FILE)
+
+    @property
+    def staging_folder(self) -> str:
+        return os.path.join(self.folder, STAGING_DIR)
+
+    def thumbnail_path(self, filename: str) -> str:
+        return os.path.join(self.folder, THUMBNAILS_DIR, filename + ".jpg")
+
+    @contextlib.contextmanager
+    def _locked(self) -> Iterator[None]:
+        # Several API processes may share the folder; the index is read-modify-written under a file lock
+        os.makedirs(self.folder, exist_ok=True)
+        with self._lock, open(os.path.join(self.folder, ".index.lock"), "a") as lock_file:
+            fcntl.flock(lock_file, fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+    def _read(self) -> dict[str, dict[str, Any]] | None:
+        try:
+            with open(self.index_path, encoding="utf-8") as file:
+                st = os.fstat(file.fileno())
+                stamp = (st.st_mtime_ns, st.st_size)
+                if self._entries is not None and stamp == self._stamp:
+                    return self._entries
+                entries = json.load(file)
+        except FileNotFoundError:
+            return None
+        self._entries, self._stamp = entries, stamp
+        return entries
+
+    def _write(self, entries: dict[str, dict[str, Any]]):
+        write_atomic(self.index_path, json.dumps(entries, ensure_ascii=False, indent=4).encode("utf-8"))
+        st = os.stat(self.index_path)
+        self._entries, self._stamp = entries, (st.st_mtime_ns, st.st_size)
+
+    def entries(self) -> dict[str, dict[str, Any]]:
+        entries = self._read()
+        if entries is not None:
+            return entries
+        with self._locked():
+            entries = self._read()
+            if entries is None:
+                entries = self._scan()
+                self._write(entries)
+            return entries
+
+    def _scan(self) -> dict[str, dict[str, Any]]:
+        # Templates that predate the index are described as they are; only new uploads are normalized
+        entries = {}
+        for name in sorted(os.listdir(self.folder)):
+            path = os.path.join(self.folder, name)
+            if name.startswith(".") or not os.path.isfile(path):
+                continue
+            try:
+                entries[name] = {"filename": name, "status": "ready", **describe_template(path), "scale": 1.0}
+            except OSError as e:
+                logger.warning("Skipping unreadable template %s: %s", name, e)
+        return entries
+
+    def update(self, filename: str, **fields: Any) -> dict[str, Any]:
+        with self._locked():
+            entries = dict(self._read() or self._scan())
+            entry = {**entries.get(filename, {"filename": filename}), **fields, "updated_at": time.time()}
+            entries[filename] = entry
+            self._write(entries)
+            return entry
+
+    def remove(self, filename: str):
+        with self._locked():
+            entries = dict(self._read() or self._scan())
+            if entries.pop(filename, None) is not None:
+                self._write(entries)
+        # An upload that was never ingested still has its staged copy
+        for path in (self.thumbnail_path(filename), os.path.join(self.staging_folder, filename)):
+            with contextlib.suppress(FileNotFoundError):
+                os.remove(path)
+
+    def write_thumbnail(self, filename: str, image: Image.Image):
+        thumbnail = image.convert("RGB") if image.mode != "RGB" else image.copy()
+        size = settings.TEMPLATE_THUMBNAIL_SIZE
+        thumbnail.thumbnail((size, size), Image.Resampling.LANCZOS)
+        path = self.thumbnail_path(filename)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        buf = io.BytesIO()
+        thumbnail.save(buf, format="JPEG", quality=80)
+        write_atomic(path, buf.getvalue())
+
+    def ensure_thumbnail(self, filename: str) -> str:
+        path = self.thumbnail_path(filename)
+        if not os.path.exists(path):
+            with Image.open(os.path.join(self.folder, filename)) as image:
+                image.draft("RGB", (settings.TEMPLATE_THUMBNAIL_SIZE, settings.TEMPLATE_THUMBNAIL_SIZE))
+                self.write_thumbnail(filename, image)
+        return path
+
+
+template_index = TemplateIndex(settings.TEMPLATE_FOLDER)
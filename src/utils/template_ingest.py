@@ -0,0 +1,142 @@
+import contextlib
+import io
+import logging
+import os
+import threading
+from typing import Any
+
+from fastapi.concurrency import run_in_threadpool
+from PIL import Image, ImageOps
+
+from src.config import settings
+from src.utils.config_repo import config_repo
+from src.utils.config_store import publish_assets_changed
+from src.utils.template_index import describe_template, template_index, write_atomic
+
+logger = logging.getLogger(__name__)
+
+_METADATA_KEYS = ("exif", "icc_profile", "xmp", "XML:com.adobe.xmp", "photoshop", "comment")
+_EXIF_ORIENTATION = 0x0112
+
+# Decoding a large template can take hundreds of megabytes; one ingestion at a time is plenty
+_ingest_lock = threading.Lock()
+
+
+def _to_rgb(image: Image.Image) -> Image.Image:
+    if image.mode == "RGB":
+        return image
+    if "A" in image.getbands() or "transparency" in image.info:
+        rgba = image.convert("RGBA")
+        flattened = Image.new("RGB", rgba.size, "white")
+        flattened.paste(rgba, mask=rgba.getchannel("A"))
+        return flattened
+    return image.convert("RGB")
+
+
+def _encode(image: Image.Image, image_format: str) -> bytes:
+    buf = io.BytesIO()
+    if image_format == "JPEG":
+        image.save(buf, format="JPEG", quality=settings.TEMPLATE_JPEG_QUALITY, subsampling=0)
+    else:
+        # Renders open templates by content, so anything that isn't a JPEG is stored as a lossless PNG
+        image.save(buf, format="PNG")
+    return buf.getvalue()
+
+
+def _normalize(filename: str) -> tuple[dict[str, Any], float] | None:
+    staged = os.path.join(template_index.staging_folder, filename)
+    target = os.path.join(template_index.folder, filename)
+    with _ingest_lock:
+        previous = template_index.entries().get(filename, {})
+        try:
+            source = Image.open(staged)
+        except FileNotFoundError:
+            # A concurrent upload of the same name was ingested together with this one
+            return None
+        with source:
+            original = {
+                "width": source.width,
+                "height": source.height,
+                "mode": source.mode,
+                "format": source.format,
+                "bytes": os.path.getsize(staged),
+            }
+            rotated = source.getexif().get(_EXIF_ORIENTATION, 1) != 1
+            has_metadata = any(key in source.info for key in _METADATA_KEYS) or bool(source.info.get("progressive"))
+            image = _to_rgb(ImageOps.exif_transpose(source))
+
+        oriented_width = image.width
+        longest = max(image.size)
+        if settings.TEMPLATE_MAX_DIMENSION and longest > settings.TEMPLATE_MAX_DIMENSION:
+            factor = settings.TEMPLATE_MAX_DIMENSION / longest
+            size = (max(1, round(image.width * factor)), max(1, round(image.height * factor)))
+            image = image.resize(size, Image.Resampling.LANCZOS)
+
+        rewrite = (
+            image.width != oriented_width
+            or rotated
+            or has_metadata
+            or original["mode"] != "RGB"
+            or original["format"] not in ("JPEG", "PNG")
+        )
+        if rewrite:
+            write_atomic(target, _encode(image, original["format"]))
+            os.remove(staged)
+        else:
+            os.replace(staged, target)
+        template_index.write_thumbnail(filename, image)
+
+        # Presets were laid out against whatever was stored before, or against the upload itself for a new name
+        scale = 1.0
+        if image.width != oriented_width:
+            basis = previous["width"] if "sha256" in previous else oriented_width
+            scale = image.width / basis
+        fields = {
+            "status": "ready",
+            **describe_template(target),
+            "original": original,
+            "scale": scale,
+            "normalized": rewrite,
+            "error": None,
+        }
+        return fields, scale
+
+
+async def _rescale_presets(filename: str, scale: float):
+    state = await config_repo.snapshot()
+    if not any(p.get("template") == filename for p in state.presets.values()):
+        return
+
+    def mutate(cfg: dict[str, Any]):
+        for preset in cfg.get("presets", []):
+            if preset.get("template") != filename:
+                continue
+            for text in preset.get("texts", []):
+                text["x"] = round(text["x"] * scale)
+                text["y"] = round(text["y"] * scale)
+                text["size"] = max(1, round(text["size"] * scale))
+
+    await config_repo.modify(mutate)
+
+
+async def ingest_template(filename: str):
+    try:
+        result = await run_in_threadpool(_normalize, filename)
+    except Exception as e:
+        logger.error("Failed to ingest template %s: %s", filename, e)
+        with contextlib.suppress(FileNotFoundError):
+            await run_in_threadpool(os.remove, os.path.join(template_index.staging_folder, filename))
+        await run_in_threadpool(template_index.update, filename, status="failed", error=str(e))
+        return
+    if result is None:
+        return
+
+    fields, scale = result
+    if scale != 1.0:
+        try:
+            await _rescale_presets(filename, scale)
+        except Exception as e:
+            logger.error("Failed to rescale presets for template %s: %s", filename, e)
+            fields["error"] = f"Presets were not rescaled by {scale:.4f}: {e!s}"
+    await run_in_threadpool(template_index.update, filename, **fields)
+    await run_in_threadpool(publish_assets_changed)
@@ -0,0 +1,104 @@
+import contextlib
+import hashlib
+import logging
+import mmap
+import os
+import struct
+import tempfile
+
+from PIL import Image
+
+from src.config import settings
+from src.utils.template_cache import template_cache
+
+logger = logging.getLogger(__name__)
+
+_MAGIC = b"IMGT"
+_HEADER = struct.Struct("<4sII8s")
+_HEADER_SIZE = 64
+
+# Pillow can only wrap a buffer without copying for 1- and 4-byte-per-pixel layouts, so RGB is padded to RGBX
+_STORED_MODES = {"RGB": "RGBX", "RGBX": "RGBX", "L": "L", "CMYK": "CMYK"}
+
+
+def _prefix(path: str) -> str:
+    return hashlib.sha256(os.path.abspath(path).encode("utf-8")).hexdigest()[:32]
+
+
+class TemplateStore:
+    def __init__(self, folder: str):
+        self.folder = folder
+
+    def get(self, path: str) -> Image.Image:
+        if not self.folder:
+            return template_cache.get(path)
+
+        st = os.stat(path)
+        prefix = _prefix(path)
+        store_path = os.path.join(self.folder, f"{prefix}-{st.st_mtime_ns:x}-{st.st_size:x}.raw")
+        try:
+            return self._map(store_path)
+        except FileNotFoundError:
+            pass
+
+        with Image.open(path) as src:
+            if src.mode not in _STORED_MODES:
+                return template_cache.get(path)
+            src.load()
+            image = src.convert(_STORED_MODES[src.mode]) if src.mode == "RGB" else src.copy()
+
+        try:
+            self._write(store_path, prefix, image)
+        except OSError as e:
+            logger.warning("Failed to add %s to the template store: %s", path, e)
+            return image
+        return self._map(store_path)
+
+    def _map(self, store_path: str) -> Image.Image:
+        with open(store_path, "rb") as file:
+            # A private mapping: pages are shared with every other process until this one writes to them
+            mm = mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_COPY)
+        magic, width, height, mode = _HEADER.unpack_from(mm)
+        if magic != _MAGIC:
+            mm.close()
+            raise FileNotFoundError("Corrupt template store entry: " + store_path)
+        mode = mode.rstrip(b"\0").decode("ascii")
+        image = Image.frombuffer(mode, (width, height), memoryview(mm)[_HEADER_SIZE:], "raw", mode, 0, 1)
+        # frombuffer marks the image read-only and would copy it on the first draw; the mapping is private so
+        # drawing only duplicates the pages it touches
+        image.readonly = 0
+        return image
+
+    def _write(self, store_path: str, prefix: str, image: Image.Image):
+        os.makedirs(self.folder, exist_ok=True)
+        fd, tmp_path = tempfile.mkstemp(dir=self.folder, suffix=".tmp")
+        try:
+            with os.fdopen(fd, "wb") as file:
+                header = _HEADER.pack(_MAGIC, image.width, image.height, image.mode.encode("ascii"))
+                file.write(header.ljust(_HEADER_SIZE, b"\0"))
+                file.write(image.tobytes())
+            os.replace(tmp_path, store_path)
+        except BaseException:
+            with contextlib.suppress(FileNotFoundError):
+                os.remove(tmp_path)
+            raise
+
+        # Drop entries built from older versions of the same template
+        self._remove_entries(prefix, keep=store_path)
+
+    def discard(self, path: str):
+        if self.folder:
+            self._remove_entries(_prefix(path))
+
+    def _remove_entries(self, prefix: str, keep: str | None = None):
+        try:
+            names = os.listdir(self.folder)
+        except FileNotFoundError:
+            return
+        for name in names:
+            if name.startswith(prefix + "-") and os.path.join(self.folder, name) != keep:
+                with contextlib.suppress(FileNotFoundError):
+                    os.remove(os.path.join(self.folder, name))
+
+
+template_store = TemplateStore(settings.TEMPLATE_STORE_DIR)
@@ -0,0 +1,70 @@
+import functools
+import os
+import threading
+from collections import OrderedDict
+from typing import NamedTuple
+
+from PIL import Image, ImageDraw, ImageFont
+
+from src.config import settings
+
+
+class TextSprite(NamedTuple):
+    mask: Image.Image
+    offset: tuple[int, int]
+
+
+@functools.lru_cache(maxsize=64)
+def _load_font(path: str, size: int, mtime_ns: int) -> ImageFont.FreeTypeFont:
+    return ImageFont.truetype(path, size)
+
+
+class TextSpriteCache:
+    def __init__(self, max_items: int):
+        self.max_items = max_items
+        self._entries: OrderedDict[tuple, TextSprite] = OrderedDict()
+        self._lock = threading.Lock()
+        # FreeType faces are not safe to rasterize from several threads at once
+        self._raster_lock = threading.Lock()
+
+    def get(self, font_path: str, font_size: int, text: str) -> TextSprite:
+        try:
+            mtime_ns = os.stat(font_path).st_mtime_ns
+        except FileNotFoundError:
+            raise FileNotFoundError("Font not found: " + font_path)  # noqa: B904
+
+        # The mask only holds coverage, so one sprite serves every color the text is drawn in
+        key = (font_path, font_size, mtime_ns, text)
+        with self._lock:
+            sprite = self._entries.get(key)
+            if sprite is not None:
+                self._entries.move_to_end(key)
+                return sprite
+
+        with self._raster_lock:
+            sprite = self._rasterize(_load_font(font_path, font_size, mtime_ns), text)
+        with self._lock:
+            self._entries[key] = sprite
+            while len(self._entries) > self.max_items:
+                self._entries.popitem(last=False)
+        return sprite
+
+    @staticmethod
+    def _rasterize(font: ImageFont.FreeTypeFont, text: str) -> TextSprite:
+        if "\n" in text:
+            # getbbox measures a single line; draw.text lays line breaks out with multiline_text
+            left, top, right, bottom = ImageDraw.Draw(Image.new("L", (1, 1))).multiline_textbbox(
+                (0, 0), text, font=font
+            )
+        else:
+            left, top, right, bottom = font.getbbox(text)
+        mask = Image.new("L", (max(1, right - left), max(1, bottom - top)))
+        ImageDraw.Draw(mask).text((-left, -top), text, font=font, fill=255)
+        return TextSprite(mask, (left, top))
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+
+text_sprites = TextSpriteCache(settings.TEXT_SPRITE_CACHE_ITEMS)
@@ -0,0 +1,14 @@
+import os
+
+# Settings are read on import; the tests never reach SMTP
+for _name, _value in {
+    "API_KEY": "test-key",
+    "CONFIG_PATH": "storage/config.json",
+    "TEMPLATE_FOLDER": "storage/templates",
+    "FONT_FOLDER": "storage/fonts",
+    "SMTP_SERVER": "localhost",
+    "SMTP_PORT": "465",
+    "SMTP_USER": "test@example.com",
+    "SMTP_PASSWORD": "test",
+}.items():
+    os.environ.setdefault(_name, _value)
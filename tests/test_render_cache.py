@@ -0,0 +1,34 @@
+import os
+
+import pytest
+
+from src.utils.render_cache import RenderCache
+
+KEY = "ab" + "0" * 62
+JPEG = b"\xff\xd8jpeg body\xff\xd9"
+
+
+@pytest.fixture
+def cache(tmp_path) -> RenderCache:
+    return RenderCache(str(tmp_path), ttl=3600, max_bytes=1024 * 1024, use_redis=False)
+
+
+def test_hit_returns_stored_bytes(cache):
+    cache.put(KEY, JPEG)
+    assert cache.get(KEY) == JPEG
+
+
+def test_truncated_entry_is_a_miss_and_removed(cache):
+    cache.put(KEY, JPEG)
+    path = cache._path(KEY)
+    with open(path, "wb") as file:
+        file.write(JPEG[:5])
+    assert cache.get(KEY) is None
+    assert not os.path.exists(path)
+
+
+def test_unreadable_entry_is_a_miss_and_removed(cache):
+    path = cache._path(KEY)
+    # A directory where the file should be makes open() fail with an OSError other than FileNotFoundError
+    os.makedirs(path)
+    assert cache.get(KEY) is None
@@ -0,0 +1,64 @@
+import os
+
+import pytest
+from fastapi import FastAPI, status
+from fastapi.testclient import TestClient
+from PIL import Image
+
+from src.config import settings
+from src.routers import config_editor
+from src.utils.template_index import template_index
+from src.utils.template_store import template_store
+
+
+@pytest.fixture
+def folders(tmp_path, monkeypatch):
+    templates, store = tmp_path / "templates", tmp_path / "store"
+    templates.mkdir()
+    monkeypatch.setattr(settings, "TEMPLATE_FOLDER", str(templates))
+    monkeypatch.setattr(template_index, "folder", str(templates))
+    monkeypatch.setattr(template_index, "_entries", None)
+    monkeypatch.setattr(template_store, "folder", str(store))
+    monkeypatch.setattr(config_editor, "publish_assets_changed", lambda: None)
+    return templates, store
+
+
+@pytest.fixture
+def client():
+    app = FastAPI()
+    app.include_router(config_editor.router)
+    with TestClient(app) as client:
+        yield client
+
+
+def test_delete_removes_store_entries_and_staged_upload(client, folders):
+    templates, store = folders
+    path = templates / "party.jpg"
+    Image.new("RGB", (64, 48), "red").save(path)
+    template_store.get(str(path))
+    template_index.write_thumbnail("party.jpg", Image.new("RGB", (64, 48)))
+    os.makedirs(template_index.staging_folder)
+    (templates / ".incoming" / "party.jpg").write_bytes(b"staged")
+    assert os.listdir(store)
+    assert "party.jpg" in template_index.entries()
+
+    response = client.delete("/config/api/templates/party.jpg", headers={"api-key": settings.API_KEY})
+
+    assert response.status_code == status.HTTP_200_OK
+    assert os.listdir(store) == []
+    assert not path.exists()
+    assert not os.path.exists(template_index.thumbnail_path("party.jpg"))
+    assert os.listdir(template_index.staging_folder) == []
+    assert "party.jpg" not in template_index.entries()
+
+
+def test_delete_keeps_other_templates_in_the_store(client, folders):
+    templates, store = folders
+    for name in ("party.jpg", "wedding.jpg"):
+        Image.new("RGB", (64, 48), "red").save(templates / name)
+        template_store.get(str(templates / name))
+
+    client.delete("/config/api/templates/party.jpg", headers={"api-key": settings.API_KEY})
+
+    assert len(os.listdir(store)) == 1
+    assert template_store.get(str(templates / "wedding.jpg")).size == (64, 48)
@@ -0,0 +1,49 @@
+import pytest
+from PIL import Image, ImageChops, ImageDraw, ImageFont
+
+from src.utils.img_gen import _draw_text_on_image
+from src.utils.text_sprites import text_sprites
+
+FONT_PATH = "storage/fonts/Roboto.ttf"
+
+
+@pytest.fixture(autouse=True)
+def _clear_sprites():
+    text_sprites.clear()
+    yield
+    text_sprites.clear()
+
+
+def _direct_render(text: str, position: tuple[int, int], font_size: int) -> Image.Image:
+    image = Image.new("RGB", (900, 300), "white")
+    ImageDraw.Draw(image).text(position, text, font=ImageFont.truetype(FONT_PATH, font_size), fill="#1a2b3c")
+    return image
+
+
+def _sprite_render(text: str, position: tuple[int, int], font_size: int) -> Image.Image:
+    image = Image.new("RGB", (900, 300), "white")
+    _draw_text_on_image(image, text, position, FONT_PATH, font_size, "#1a2b3c")
+    return image
+
+
+@pytest.mark.parametrize(
+    "text",
+    [
+        "Moscow, Tverskaya street 1",
+        "Moscow,\nTverskaya street 1, building 2",
+        "first line\n\nthird line after a blank one\n",
+    ],
+)
+def test_sprite_matches_direct_render(text):
+    direct = _direct_render(text, (40, 30), 32)
+    sprite = _sprite_render(text, (40, 30), 32)
+    assert ImageChops.difference(direct, sprite).getbbox() is None
+
+
+def test_multiline_sprite_covers_every_line():
+    text = "Moscow,\nTverskaya street 1, building 2"
+    font = ImageFont.truetype(FONT_PATH, 32)
+    left, top, right, bottom = ImageDraw.Draw(Image.new("L", (1, 1))).multiline_textbbox((0, 0), text, font=font)
+    sprite = text_sprites.get(FONT_PATH, 32, text)
+    assert sprite.offset == (left, top)
+    assert sprite.mask.size == (right - left, bottom - top)
@@ -0,0 +1,89 @@
+import os
+
+import pytest
+from fastapi import FastAPI, status
+from fastapi.testclient import TestClient
+
+from src.config import settings
+from src.routers import config_editor
+from src.utils.upload_limit import UploadLimitMiddleware
+
+MAX_BYTES = 1024
+# _store_upload reports "File exceeds ..."; this message means the body was cut off before form parsing
+REJECTED_EARLY = f"Upload exceeds {MAX_BYTES} bytes"
+
+
+@pytest.fixture
+def font_folder(tmp_path, monkeypatch):
+    monkeypatch.setattr(settings, "FONT_FOLDER", str(tmp_path))
+    monkeypatch.setattr(settings, "UPLOAD_MAX_BYTES", MAX_BYTES)
+    monkeypatch.setattr(config_editor, "publish_assets_changed", lambda: None)
+    return tmp_path
+
+
+@pytest.fixture
+def client():
+    app = FastAPI()
+    app.add_middleware(UploadLimitMiddleware, max_bytes=MAX_BYTES)
+    app.include_router(config_editor.router)
+    with TestClient(app) as client:
+        yield client
+
+
+def _multipart(file_bytes: bytes) -> tuple[bytes, str]:
+    boundary = "test-boundary"
+    body = (
+        (
+            f'--{boundary}\r\nContent-Disposition: form-data; name="file"; filename="big.ttf"\r\n'
+            "Content-Type: application/octet-stream\r\n\r\n"
+        ).encode()
+        + file_bytes
+        + f"\r\n--{boundary}--\r\n".encode()
+    )
+    return body, f"multipart/form-data; boundary={boundary}"
+
+
+def _stored(folder) -> list[str]:
+    # Rejected uploads must not leave their temporary files behind either
+    return os.listdir(folder)
+
+
+def test_small_upload_is_stored(client, font_folder):
+    response = client.post(
+        "/config/api/fonts", headers={"api-key": settings.API_KEY}, files={"file": ("small.ttf", b"x" * MAX_BYTES)}
+    )
+    assert response.status_code == status.HTTP_201_CREATED
+    assert _stored(font_folder) == ["small.ttf"]
+
+
+def test_oversized_body_is_rejected_by_content_length(client, font_folder):
+    body, content_type = _multipart(b"x" * (MAX_BYTES + 128 * 1024))
+    response = client.post(
+        "/config/api/fonts", headers={"api-key": settings.API_KEY, "content-type": content_type}, content=body
+    )
+    assert response.status_code == status.HTTP_413_REQUEST_ENTITY_TOO_LARGE
+    assert response.json()["detail"] == REJECTED_EARLY
+    assert _stored(font_folder) == []
+
+
+def test_oversized_chunked_body_is_rejected_while_streaming(client, font_folder):
+    body, content_type = _multipart(b"x" * (MAX_BYTES + 128 * 1024))
+
+    def chunks():
+        for start in range(0, len(body), 4096):
+            yield body[start : start + 4096]
+
+    response = client.post(
+        "/config/api/fonts", headers={"api-key": settings.API_KEY, "content-type": content_type}, content=chunks()
+    )
+    assert response.status_code == status.HTTP_413_REQUEST_ENTITY_TOO_LARGE
+    assert response.json()["detail"] == REJECTED_EARLY
+    assert _stored(font_folder) == []
+
+
+def test_file_over_the_limit_within_the_overhead_is_rejected(client, font_folder):
+    response = client.post(
+        "/config/api/fonts", headers={"api-key": settings.API_KEY}, files={"file": ("big.ttf", b"x" * (MAX_BYTES + 1))}
+    )
+    assert response.status_code == status.HTTP_413_REQUEST_ENTITY_TOO_LARGE
+    assert _stored(font_folder) == []